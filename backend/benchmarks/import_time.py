@@ -0,0 +1,94 @@
+"""
+Import-time budget for the API: `import main` must not open network
+connections or create database engines, and must stay within a time budget.
+
+Each run is a fresh interpreter with DATABASE_URL pointing at an unroutable
+address (it would otherwise come from .env) and the socket module patched to
+refuse connections. The budget applies to the app's own share: each run
+imports the frameworks it is built on (FastAPI, SQLAlchemy, pydantic) first,
+untimed, then times `import main` alone. That keeps the number comparable
+across machines and free of the run-to-run noise of the framework imports
+(subtracting two separately measured totals was). The median over --runs is
+checked against the budget; the spread is printed alongside. The budget is
+coarse (about 220 ms locally, 320 ms before engines and drivers were made
+lazy); the network/engine/module checks are the exact part. Exits 1 when the
+budget is exceeded or a check fails.
+
+Usage: python benchmarks/import_time.py [--runs 7] [--budget-ms 300]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FRAMEWORKS = "import fastapi, fastapi.middleware.cors, starlette.concurrency, sqlalchemy.orm, pydantic"
+
+PROBE = """
+import json, socket, sys, time
+attempts = []
+def refuse(*args, **kwargs):
+    attempts.append(repr(args[1:] or args)[:200])
+    raise OSError("network access during import")
+socket.socket.connect = socket.socket.connect_ex = refuse
+socket.create_connection = socket.getaddrinfo = refuse
+{frameworks}
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+database = sys.modules.get("database")
+print(json.dumps({{
+    "seconds": elapsed,
+    "network": attempts,
+    "engines": bool(database and (vars(database).get("_engines") or "engine" in vars(database))),
+    "modules": sorted(m for m in ("psycopg2", "asyncpg", "PIL.Image", "uvicorn") if m in sys.modules),
+}}))
+"""
+
+
+def probe() -> dict:
+    env = dict(os.environ, DATABASE_URL="postgresql://probe@192.0.2.1:5432/probe")
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE.format(frameworks=FRAMEWORKS)],
+        cwd=BACKEND_DIR, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(runs: int, budget_ms: float) -> bool:
+    probe()  # Warm the bytecode and OS file caches
+    results = [probe() for _ in range(runs)]
+    times = sorted(r["seconds"] * 1000 for r in results)
+    own_ms = statistics.median(times)
+
+    ok = True
+    print(f"import main after the frameworks: {own_ms:.0f} ms median of {runs} "
+          f"(min {times[0]:.0f}, max {times[-1]:.0f}; budget {budget_ms:.0f} ms)")
+    if own_ms > budget_ms:
+        print("  ✗ over budget")
+        ok = False
+    last = results[-1]
+    if last["network"]:
+        print(f"  ✗ network access during import: {last['network']}")
+        ok = False
+    if last["engines"]:
+        print("  ✗ database engines created during import")
+        ok = False
+    if last["modules"]:
+        print(f"  ✗ imported eagerly: {', '.join(last['modules'])}")
+        ok = False
+    if ok:
+        print("  ✓ no network, no engines, drivers and Pillow not imported")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time budget for main.py")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="allowed time for import main once the frameworks are loaded")
+    args = parser.parse_args()
+    if not main(args.runs, args.budget_ms):
+        sys.exit(1)
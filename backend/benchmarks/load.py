@@ -0,0 +1,337 @@
+"""
+Load benchmark: starts the API with uvicorn against a throwaway SQLite file
+(or the database given with --database-url), seeds the menu, drives a mix of
+client traffic from N threads and reports throughput and p50/p95/p99 latency
+per operation. Results are written as JSON so runs can be compared.
+
+    python benchmarks/load.py                                  # SQLite, default mix
+    python benchmarks/load.py --database-url postgresql://... --concurrency 32 --duration 30
+    python benchmarks/load.py --env FAST_JSON=1 --env DB_ASYNC=1 --output after.json
+    python benchmarks/load.py --scenario points-race           # concurrent spends on one user
+
+The points-race scenario sends alternating earn/spend orders for a single user
+from every thread and exits 1 if the final balance doesn't match the orders
+that succeeded (lost updates / double spends).
+
+Runs are reproducible for a given --seed: every thread draws its operations
+from its own random.Random(seed + thread index).
+"""
+import argparse
+import datetime
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = "menu=40,user=15,auth=10,order=15,favorites=10,favorite_toggle=10"
+USER_ID_BASE = 9_000_000_000  # Benchmark users stay clear of real Telegram ids
+RACE_USER_ID = USER_ID_BASE - 1
+
+
+class Client:
+    """Keep-alive HTTP connection for one thread"""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+
+    def request(self, method: str, path: str, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        started = time.perf_counter()
+        try:
+            self.conn.request(method, path, payload, headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            status, etag = response.status, response.getheader("ETag")
+        except (http.client.HTTPException, OSError):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+            status, data, etag = 0, b"", None
+        return status, data, etag, time.perf_counter() - started
+
+    def close(self):
+        self.conn.close()
+
+
+# --- Server ---
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_env(args) -> dict:
+    env = dict(os.environ, DATABASE_URL=args.database_url, AUTO_MIGRATE="1")
+    for pair in args.env:
+        key, _, value = pair.partition("=")
+        env[key] = value
+    return env
+
+
+def start_server(args, port: int) -> subprocess.Popen:
+    env = server_env(args)
+    subprocess.run([sys.executable, "seed_menu.py"], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"Server exited with code {server.returncode}")
+        try:
+            status, _, _, _ = Client(port).request("GET", "/api/menu")
+            if status == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise SystemExit("Server did not become ready within 60s")
+
+
+# --- Traffic ---
+def parse_mix(mix: str) -> tuple:
+    ops, weights = [], []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation '{name}' (choose from {', '.join(OPERATIONS)})")
+        ops.append(name)
+        weights.append(float(weight or 1))
+    return ops, weights
+
+
+def op_menu(client, rng, ctx, state):
+    # Clients revalidate with If-None-Match (services/api.ts uses cache: 'no-cache')
+    headers = {"If-None-Match": state["menu_etag"]} if state.get("menu_etag") and rng.random() < 0.7 else None
+    status, _, etag, elapsed = client.request("GET", "/api/menu", headers=headers)
+    if etag:
+        state["menu_etag"] = etag
+    return status, elapsed
+
+
+def op_user(client, rng, ctx, state):
+    status, _, _, elapsed = client.request("GET", f"/api/users/{rng.choice(ctx['user_ids'])}")
+    return status, elapsed
+
+
+def op_auth(client, rng, ctx, state):
+    user_id = rng.choice(ctx["user_ids"])
+    status, _, _, elapsed = client.request("POST", "/api/auth", {"id": user_id, "name": f"Bench {user_id}"})
+    return status, elapsed
+
+
+def op_order(client, rng, ctx, state):
+    order = {
+        "user_id": rng.choice(ctx["user_ids"]),
+        "items_summary": "Benchmark order",
+        "total_price": rng.choice((150, 250, 350, 450)),
+        "points_used": 0 if rng.random() < 0.8 else rng.choice((10, 50)),
+    }
+    status, _, _, elapsed = client.request("POST", "/api/orders", order)
+    return status, elapsed
+
+
+def op_favorites(client, rng, ctx, state):
+    status, _, _, elapsed = client.request("GET", f"/api/users/{rng.choice(ctx['user_ids'])}/favorites")
+    return status, elapsed
+
+
+def op_favorite_toggle(client, rng, ctx, state):
+    path = f"/api/users/{rng.choice(ctx['user_ids'])}/favorites/{rng.choice(ctx['product_ids'])}"
+    status, _, _, elapsed = client.request("POST" if rng.random() < 0.5 else "DELETE", path)
+    return status, elapsed
+
+
+OPERATIONS = {
+    "menu": op_menu,
+    "user": op_user,
+    "auth": op_auth,
+    "order": op_order,
+    "favorites": op_favorites,
+    "favorite_toggle": op_favorite_toggle,
+}
+EXPECTED_STATUSES = {200, 304, 400}  # 400 = not enough points, a normal answer
+
+
+def prepare(port: int, args) -> dict:
+    client = Client(port)
+    user_ids = [USER_ID_BASE + i for i in range(args.users)]
+    for user_id in user_ids + [RACE_USER_ID]:
+        client.request("POST", "/api/auth", {"id": user_id, "name": f"Bench {user_id}"})
+    _, body, _, _ = client.request("GET", "/api/menu")
+    product_ids = [p["id"] for c in json.loads(body)["categories"] for p in c["products"]]
+    client.close()
+    return {"user_ids": user_ids, "product_ids": product_ids}
+
+
+def worker(index: int, port: int, args, ctx, deadline: float, warmup_until: float, samples: list):
+    rng = random.Random(args.seed + index)
+    ops, weights = parse_mix(args.mix)
+    client = Client(port)
+    state = {}
+    while time.monotonic() < deadline:
+        name = rng.choices(ops, weights)[0]
+        status, elapsed = OPERATIONS[name](client, rng, ctx, state)
+        if time.monotonic() >= warmup_until:
+            samples.append((name, status, elapsed))
+    client.close()
+
+
+def race_worker(index: int, port: int, args, results: list):
+    client = Client(port)
+    for i in range(args.race_orders):
+        spend = (index + i) % 2 == 1
+        order = {"user_id": RACE_USER_ID, "items_summary": "Race", "total_price": 100, "points_used": 10 if spend else 0}
+        status, body, _, elapsed = client.request("POST", "/api/orders", order)
+        results.append(("order", status, elapsed, json.loads(body) if status == 200 else None))
+    client.close()
+
+
+# --- Reporting ---
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    by_op = defaultdict(list)
+    for name, status, latency, *_ in samples:
+        by_op[name].append((status, latency))
+        by_op["all"].append((status, latency))
+    summary = {}
+    for name, rows in by_op.items():
+        latencies = sorted(latency for _, latency in rows)
+        statuses = defaultdict(int)
+        for status, _ in rows:
+            statuses[str(status)] += 1
+        summary[name] = {
+            "requests": len(rows),
+            "errors": sum(1 for status, _ in rows if status not in EXPECTED_STATUSES),
+            "throughput_rps": round(len(rows) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+            "statuses": dict(statuses),
+        }
+    return summary
+
+
+def print_summary(summary: dict):
+    print(f"{'operation':<17}{'requests':>9}{'errors':>8}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name in sorted(summary, key=lambda n: (n == "all", n)):
+        s = summary[name]
+        print(f"{name:<17}{s['requests']:>9}{s['errors']:>8}{s['throughput_rps']:>9}"
+              f"{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}")
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args) -> int:
+    port = free_port()
+    server = start_server(args, port)
+    exit_code = 0
+    try:
+        ctx = prepare(port, args)
+        samples, threads = [], []
+        started = time.monotonic()
+        if args.scenario == "points-race":
+            before = json.loads(Client(port).request("GET", f"/api/users/{RACE_USER_ID}")[1])
+            threads = [threading.Thread(target=race_worker, args=(i, port, args, samples)) for i in range(args.concurrency)]
+        else:
+            warmup_until = started + args.warmup
+            deadline = warmup_until + args.duration
+            threads = [
+                threading.Thread(target=worker, args=(i, port, args, ctx, deadline, warmup_until, samples))
+                for i in range(args.concurrency)
+            ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started - (args.warmup if args.scenario == "mix" else 0)
+
+        summary = summarize(samples, elapsed)
+        result = {
+            "scenario": args.scenario,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "database": args.database_url.split("://")[0],
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "database_url")},
+            "elapsed_s": round(elapsed, 2),
+            "results": summary,
+        }
+
+        if args.scenario == "points-race":
+            after = json.loads(Client(port).request("GET", f"/api/users/{RACE_USER_ID}")[1])
+            orders = [row[3] for row in samples if row[3] is not None]
+            expected = before["points"] + sum(o["points_earned"] - o["points_used"] for o in orders)
+            result["race"] = {
+                "orders_ok": len(orders),
+                "points_before": before["points"],
+                "points_after": after["points"],
+                "points_expected": expected,
+                "consistent": after["points"] == expected and after["points"] >= 0,
+            }
+            print(f"Points: before {before['points']}, after {after['points']}, expected {expected} "
+                  f"({len(orders)} orders ok) -> {'OK' if result['race']['consistent'] else 'INCONSISTENT'}")
+            if not result["race"]["consistent"]:
+                exit_code = 1
+
+        print_summary(summary)
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+    return exit_code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load benchmark for the Hoffee Shop API")
+    parser.add_argument("--database-url", help="defaults to a fresh SQLite file in a temp dir")
+    parser.add_argument("--scenario", choices=("mix", "points-race"), default="mix")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation=weight list (default {DEFAULT_MIX})")
+    parser.add_argument("--concurrency", type=int, default=16, help="client threads")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds (mix)")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds before (mix)")
+    parser.add_argument("--race-orders", type=int, default=50, help="orders per thread (points-race)")
+    parser.add_argument("--users", type=int, default=200, help="distinct benchmark users")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra server env")
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.database_url is None:
+            args.database_url = f"sqlite:///{os.path.join(tmp, 'benchmark.db')}"
+        sys.exit(run(args))
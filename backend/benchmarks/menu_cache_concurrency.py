@@ -0,0 +1,110 @@
+"""
+Concurrency check for menu_cache: many simultaneous /api/menu misses must
+neither freeze the worker nor each rebuild the menu.
+
+Runs the app in-process on a temporary SQLite file, in sync mode and with
+DB_ASYNC=1 (aiosqlite), one subprocess each. It invalidates the cache and
+sends --requests concurrent GET /api/menu, also with an admin write in the
+middle. A watchdog (faulthandler) kills the run and dumps the stacks if the
+event loop hangs. Exits 1 on a hang, a failed request, or more than one menu
+build per burst.
+
+Usage: python benchmarks/menu_cache_concurrency.py [--requests 20] [--timeout 20]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def burst(requests: int) -> dict:
+    import asyncio
+    import faulthandler
+
+    import httpx
+    from sqlalchemy import event
+
+    import database, main
+    from menu_cache import menu_cache
+
+    builds = []
+    # get_menu's first statement is the categories query
+    listener = lambda conn, cursor, statement, *args: builds.append(1) if "FROM categories" in statement else None
+    event.listen(database.engine, "before_cursor_execute", listener)
+    if database.async_engine is not None:
+        event.listen(database.async_engine.sync_engine, "before_cursor_execute", listener)
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app), httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        admin = 1962824399  # crud.create_user makes this id an admin
+        await client.post("/api/auth", json={"id": admin, "name": "Admin"})
+        await client.post(f"/api/admin/categories?admin_id={admin}", json={"id": "c0", "name": "C0", "sort_order": 0})
+
+        menu_cache.invalidate()
+        builds.clear()
+        responses = await asyncio.gather(*(client.get("/api/menu") for _ in range(requests)))
+        results["misses"] = ([r.status_code for r in responses], len(builds))
+
+        # Misses racing an admin write: every response is a valid menu, and the
+        # cache ends up with the new category
+        builds.clear()
+        tasks = [client.get("/api/menu") for _ in range(requests)]
+        tasks.insert(requests // 2, client.post(
+            f"/api/admin/categories?admin_id={admin}", json={"id": "c1", "name": "C1", "sort_order": 1}
+        ))
+        responses = await asyncio.gather(*tasks)
+        final = (await client.get("/api/menu")).json()
+        results["write"] = ([r.status_code for r in responses], [c["id"] for c in final["categories"]])
+    faulthandler.cancel_dump_traceback_later()
+    return results
+
+
+def child(requests: int, timeout: float):
+    import asyncio
+    import faulthandler
+
+    faulthandler.dump_traceback_later(timeout, exit=True)  # A frozen loop can't time itself out
+    results = asyncio.run(burst(requests))
+    statuses, builds = results["misses"]
+    ok = all(status == 200 for status in statuses) and builds == 1
+    print(f"  {'✓' if ok else '✗'} {len(statuses)} concurrent misses: {builds} menu build(s), statuses {sorted(set(statuses))}")
+    statuses, categories = results["write"]
+    write_ok = all(status == 200 for status in statuses) and categories == ["c0", "c1"]
+    print(f"  {'✓' if write_ok else '✗'} misses racing an admin write: statuses {sorted(set(statuses))}, cached menu {categories}")
+    sys.exit(0 if ok and write_ok else 1)
+
+
+def main(requests: int, timeout: float) -> bool:
+    ok = True
+    for db_async in ("0", "1"):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ, DB_ASYNC=db_async, CACHE_BUS="0",
+                DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'menu.db')}",
+            )
+            print(f"DB_ASYNC={db_async}")
+            result = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", "--requests", str(requests), "--timeout", str(timeout)],
+                cwd=BACKEND_DIR, env=env,
+            )
+            if result.returncode != 0:
+                print(f"  ✗ failed (exit {result.returncode}; a hang prints the stacks above)")
+                ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="menu_cache concurrency check")
+    parser.add_argument("--requests", type=int, default=20, help="concurrent requests per burst")
+    parser.add_argument("--timeout", type=float, default=20.0, help="seconds before a run counts as hung")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        sys.path.insert(0, BACKEND_DIR)
+        child(args.requests, args.timeout)
+    if not main(args.requests, args.timeout):
+        sys.exit(1)
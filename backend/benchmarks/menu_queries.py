@@ -0,0 +1,80 @@
+"""
+Query-count check for crud.get_menu: loading the Category -> Product ->
+Modifier tree must take the same number of SQL statements however big the
+menu is (no N+1 from lazy loads).
+
+Runs against in-memory SQLite at two menu sizes, counts cursor executions
+during crud.get_menu and touching every product's modifiers, and exits 1 if
+the counts differ. selectinload puts at most 500 keys in one IN (...), so
+both menus stay under 500 products.
+
+Usage: python benchmarks/menu_queries.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import crud, models, schemas
+
+
+def build_menu(categories: int, products: int, modifiers: int) -> schemas.MenuSync:
+    return schemas.MenuSync(categories=[
+        {
+            "id": f"c{c}", "name": f"Category {c}", "sort_order": c,
+            "products": [
+                {
+                    "name": f"Product {c}-{p}", "price": 100 + p, "sort_order": p,
+                    "modifiers": [
+                        {"modifier_type": "size", "name": f"Size {m}", "price": m * 10}
+                        for m in range(modifiers)
+                    ],
+                }
+                for p in range(products)
+            ],
+        }
+        for c in range(categories)
+    ])
+
+
+def count_queries(menu: schemas.MenuSync) -> tuple:
+    """(statements run by get_menu, products loaded)"""
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    crud.sync_menu(db, menu, prune=False)
+    db.expunge_all()
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        categories = crud.get_menu(db)
+        # What serialization touches; a lazy relationship would query here
+        products = [p for c in categories for p in c.products]
+        for product in products:
+            list(product.modifiers)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+        db.close()
+        engine.dispose()
+    return len(statements), len(products)
+
+
+def main() -> bool:
+    small = count_queries(build_menu(2, 3, 2))
+    large = count_queries(build_menu(20, 24, 3))
+    print(f"get_menu: {small[0]} queries for {small[1]} products, {large[0]} queries for {large[1]} products")
+    if small[0] != large[0]:
+        print("  ✗ query count grows with the menu (N+1)")
+        return False
+    print("  ✓ constant")
+    return True
+
+
+if __name__ == "__main__":
+    if not main():
+        sys.exit(1)
@@ -0,0 +1,129 @@
+"""
+Concurrency stress check for crud.create_order: --orders orders for one user
+start at the same moment (threading.Barrier), each on its own connection, and
+no points may be lost or overdrawn.
+
+Half the orders spend points and half earn them (5% cashback), so some are
+rejected with InsufficientPointsError once the balance runs low. Afterwards:
+
+    points          == start + sum(earned - used) over the accepted orders
+    lifetime_points == start + sum(earned)
+    order rows      == accepted orders, and points never went negative
+
+Exits 1 if any of these fail. Use Postgres for a meaningful run; SQLite
+serializes writers on a file lock anyway. --sqlite runs on a temporary SQLite
+file instead of the configured database.
+
+Usage: python benchmarks/points_race.py [--database-url postgresql://...] [--sqlite] [--orders 100] [--connections 50]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, delete, func, select
+from sqlalchemy.orm import sessionmaker
+
+import crud, models, schemas
+import migrations
+
+USER_ID = 424242
+START_POINTS = 1000
+START_LIFETIME = 1000
+
+
+def make_orders(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    orders = []
+    for n in range(count):
+        spend = n % 2 == 0
+        orders.append(schemas.OrderCreate(
+            user_id=USER_ID,
+            items_summary=f"Race order {n}",
+            total_price=rng.randint(200, 1000),
+            points_used=rng.randint(20, 120) if spend else 0,
+        ))
+    return orders
+
+
+def main(database_url: str, count: int, connections: int, seed: int) -> bool:
+    engine = create_engine(database_url, pool_size=connections, max_overflow=0, pool_timeout=120)
+    migrations.upgrade(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    with Session() as db:
+        db.execute(delete(models.Order).where(models.Order.user_id == USER_ID))
+        db.execute(delete(models.User).where(models.User.id == USER_ID))
+        db.add(models.User(
+            id=USER_ID, name="Race", points=START_POINTS, lifetime_points=START_LIFETIME, level_name="", is_admin=False,
+        ))
+        db.commit()
+
+    orders = make_orders(count, seed)
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def place(index: int):
+        with Session() as db:
+            barrier.wait()
+            try:
+                results[index] = crud.create_order(db, orders[index])
+            except crud.InsufficientPointsError:
+                results[index] = "rejected"
+            except Exception as e:  # Deadlocks, serialization failures...
+                results[index] = e
+
+    threads = [threading.Thread(target=place, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    errors = [r for r in results if isinstance(r, Exception)]
+    accepted = [(order, result) for order, result in zip(orders, results) if isinstance(result, models.Order)]
+    earned = sum(result.points_earned for _, result in accepted)
+    used = sum(order.points_used for order, _ in accepted)
+
+    with Session() as db:
+        user = db.get(models.User, USER_ID)
+        rows = db.execute(
+            select(func.count(), func.coalesce(func.sum(models.Order.points_used), 0))
+            .where(models.Order.user_id == USER_ID)
+        ).one()
+    engine.dispose()
+
+    checks = [
+        (f"{len(accepted)} accepted, {count - len(accepted) - len(errors)} rejected, {len(errors)} errors", not errors),
+        (f"points {user.points} == {START_POINTS} + {earned} - {used}", user.points == START_POINTS + earned - used),
+        (f"lifetime_points {user.lifetime_points} == {START_LIFETIME} + {earned}", user.lifetime_points == START_LIFETIME + earned),
+        (f"{rows[0]} order rows, {rows[1]} points used in them", tuple(rows) == (len(accepted), used)),
+        ("balance never negative", user.points >= 0),
+    ]
+    for description, ok in checks:
+        print(f"  {'✓' if ok else '✗'} {description}")
+    for error in errors[:5]:
+        print(f"    {type(error).__name__}: {error}")
+    return all(ok for _, ok in checks)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="create_order concurrency stress check")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"),
+                        help="defaults to $DATABASE_URL (backend/.env sets it)")
+    parser.add_argument("--sqlite", action="store_true", help="use a temporary SQLite file instead")
+    parser.add_argument("--orders", type=int, default=100, help="concurrent orders for the one user")
+    parser.add_argument("--connections", type=int, default=50, help="connection pool size (stay under max_connections)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if not (args.database_url or args.sqlite):
+        parser.error("no database: set DATABASE_URL, pass --database-url or --sqlite")
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'race.db')}" if args.sqlite else args.database_url
+        if url.startswith("postgres://"):
+            url = url.replace("postgres://", "postgresql://", 1)
+        if not main(url, args.orders, min(args.connections, args.orders), args.seed):
+            sys.exit(1)
@@ -0,0 +1,153 @@
+"""
+Cross-worker cache invalidation over Postgres LISTEN/NOTIFY.
+
+Every uvicorn worker keeps its own menu_cache and user_cache. crud writes
+that change the menu or a user call notify() inside their transaction; the
+NOTIFY is delivered to all listeners when (and only if) the transaction
+commits. Each worker runs one Listener thread on a dedicated connection (not
+from the pool, so count one extra connection per worker) which evicts the
+affected entries from its local caches.
+
+Payload (JSON): {"entity": "menu" | "user", "ids": [...] or null for all,
+"version": writing transaction id, "origin": ORIGIN}. The worker that made
+the write has already updated its caches after commit and skips its own
+messages.
+
+SQLite and other databases have no NOTIFY: notify() does nothing and the
+listener isn't started (single-process setups don't need it).
+"""
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+from typing import Callable, Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import URL
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("CACHE_BUS", "1").lower() in ("1", "true", "yes")
+CHANNEL = "cache_invalidation"
+ORIGIN = uuid.uuid4().hex  # This process; os.getpid() can repeat across hosts
+MAX_IDS = 500  # NOTIFY payloads are limited to 8000 bytes; more ids -> evict all
+RECONNECT_DELAY = (0.5, 30.0)  # Initial and max seconds between reconnects
+
+_NOTIFY = text(
+    "SELECT pg_notify(:channel, json_build_object("
+    "'entity', CAST(:entity AS text), 'ids', CAST(:ids AS json), "
+    "'version', txid_current(), 'origin', CAST(:origin AS text))::text)"
+)
+
+
+def supported(dialect_name: str) -> bool:
+    return ENABLED and dialect_name == "postgresql"
+
+
+def notify(db: Session, entity: str, ids: Optional[Iterable] = None):
+    """Queue an invalidation of `entity` (all of it when ids is None), sent on commit"""
+    if not supported(db.get_bind().dialect.name):
+        return
+    if ids is not None:
+        ids = sorted(set(ids))
+        if len(ids) > MAX_IDS:
+            ids = None
+    db.execute(_NOTIFY, {"channel": CHANNEL, "entity": entity, "ids": json.dumps(ids), "origin": ORIGIN})
+
+
+Handler = Callable[[Optional[list]], None]  # Called with the ids, or None for everything
+
+
+class Listener:
+    """Background thread that LISTENs on CHANNEL and calls handlers[entity](ids).
+
+    After a (re)connect every handler is called with None, since messages
+    sent while the connection was down are lost.
+    """
+
+    def __init__(self, url: URL, handlers: dict):
+        # psycopg2 even when the app itself runs on asyncpg (DB_ASYNC=1)
+        self.dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+        self.handlers = handlers
+        self._stop_r, self._stop_w = os.pipe()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.connected = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="cache-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        os.write(self._stop_w, b"x")  # Wakes up select()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        os.close(self._stop_r)
+        os.close(self._stop_w)
+
+    def _run(self):
+        delay = RECONNECT_DELAY[0]
+        while not self._stopping.is_set():
+            try:
+                self._listen()
+                return
+            except Exception:
+                self.connected.clear()
+                logger.exception("Cache invalidation listener failed; reconnecting in %.1fs", delay)
+            if self._stopping.wait(delay):
+                return
+            delay = min(delay * 2, RECONNECT_DELAY[1])
+
+    def _listen(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self.dsn)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANNEL}")
+            self._dispatch({entity: None for entity in self.handlers})
+            self.connected.set()
+            while not self._stopping.is_set():
+                readable, _, _ = select.select([conn, self._stop_r], [], [])
+                if conn not in readable:
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    messages, conn.notifies[:] = list(conn.notifies), []
+                    self._dispatch(self._collect(messages))
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _collect(messages) -> dict:
+        """Merge a batch of notifications: {entity: set of ids, or None for all}"""
+        pending = {}
+        for message in messages:
+            try:
+                payload = json.loads(message.payload)
+            except ValueError:
+                logger.warning("Ignoring malformed cache invalidation: %r", message.payload)
+                continue
+            if payload.get("origin") == ORIGIN:
+                continue
+            entity, ids = payload.get("entity"), payload.get("ids")
+            if ids is None or (entity in pending and pending[entity] is None):
+                pending[entity] = None
+            else:
+                pending.setdefault(entity, set()).update(ids)
+        return pending
+
+    def _dispatch(self, pending: dict):
+        for entity, ids in pending.items():
+            handler = self.handlers.get(entity)
+            if handler is None:
+                continue
+            try:
+                handler(None if ids is None else sorted(ids))
+            except Exception:
+                logger.exception("Cache invalidation handler for %r failed", entity)
@@ -1,10 +1,32 @@
-from sqlalchemy.orm import Session
+import base64
+import datetime
+from sqlalchemy import case, delete, insert, select, tuple_, update
+from sqlalchemy.orm import Session, selectinload
 import models, schemas
 import utils
+import order_ids
+from user_cache import user_cache
+import cache_bus
 
 def get_user(db: Session, user_id: int):
     return db.query(models.User).filter(models.User.id == user_id).first()
 
+def get_user_cached(db: Session, user_id: int):
+    """schemas.User snapshot from user_cache, loaded from the database on a miss"""
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    loaded_at = user_cache.generation
+    db_user = get_user(db, user_id)
+    if db_user is None:
+        return None
+    return _cache_user(db_user, loaded_at)
+
+def _cache_user(db_user: models.User, loaded_at: int = None):
+    snapshot = schemas.User.model_validate(db_user)
+    user_cache.put(snapshot, loaded_at)
+    return snapshot
+
 def create_user(db: Session, user: schemas.UserCreate):
     # Check if admin
     is_admin = user.id in [1962824399, 937710441] 
@@ -27,6 +49,7 @@ def create_user(db: Session, user: schemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    _cache_user(db_user)
     return db_user
 
 def update_user_profile(db: Session, user_id: int, name: str, avatar_url: str):
@@ -39,8 +62,10 @@ def update_user_profile(db: Session, user_id: int, name: str, avatar_url: str):
         level_name, _ = utils.calculate_user_level(db_user.lifetime_points)
         db_user.level_name = level_name
         
+        cache_bus.notify(db, "user", [user_id])
         db.commit()
         db.refresh(db_user)
+        _cache_user(db_user)
     return db_user
 
 def update_user_points(db: Session, user_id: int, points: int, lifetime_points: int):
@@ -51,47 +76,58 @@ def update_user_points(db: Session, user_id: int, points: int, lifetime_points:
         db_user.lifetime_points = lifetime_points
         level_name, _ = utils.calculate_user_level(lifetime_points)
         db_user.level_name = level_name
+        cache_bus.notify(db, "user", [user_id])
         db.commit()
         db.refresh(db_user)
+        _cache_user(db_user)
     return db_user
 
-import random
+class InsufficientPointsError(Exception):
+    """The order spends more points than the user has"""
 
-def create_order(db: Session, order: schemas.OrderCreate):
-    # 1. Get User
-    db_user = get_user(db, order.user_id)
-    if not db_user:
-        # Should we auto-create? For now assume sync happened.
-        return None
+def level_name_expr(lifetime_points):
+    """SQL CASE equivalent of utils.calculate_user_level(...)[0]"""
+    whens = [
+        (lifetime_points >= level['pointsRequired'], level['name'])
+        for level in reversed(utils.COFFEE_LEVELS)
+    ]
+    return case(*whens, else_=utils.COFFEE_LEVELS[0]['name'])
 
-    # 2. Calculate Earned Points (5% if no points used)
-    points_earned = 0
+def calculate_points_earned(order: schemas.OrderCreate) -> int:
+    """5% cashback, only when no points are spent"""
     if order.points_used == 0:
-        points_earned = int(order.total_price * 0.05)
-    
-    # 3. Process Transaction (Deduct + Accrue)
-    # Check balance
-    if db_user.points < order.points_used:
-        # Not enough points, logic? just prevent overwrite or error?
-        # For MVP let's assume valid, but ideally error.
-        pass
-    
-    new_points = db_user.points - order.points_used + points_earned
-    new_lifetime = db_user.lifetime_points + points_earned
-    
-    # Update User
-    db_user.points = new_points
-    db_user.lifetime_points = new_lifetime
-    
-    level_name, _ = utils.calculate_user_level(new_lifetime)
-    db_user.level_name = level_name
+        return int(order.total_price * 0.05)
+    return 0
 
-    # 4. Create Order Record
-    # Generate ID
-    order_id = f"ORD-{random.randint(1000, 9999)}"
-    
+def create_order(db: Session, order: schemas.OrderCreate):
+    # 1. Calculate Earned Points (5% if no points used)
+    points_earned = calculate_points_earned(order)
+
+    # 2. Deduct + Accrue in one conditional UPDATE. The row lock it takes
+    # serializes concurrent orders of the same user, and the WHERE clause is
+    # re-checked after waiting, so balances can't go negative or lose updates.
+    new_lifetime = models.User.lifetime_points + points_earned
+    updated = db.execute(
+        update(models.User)
+        .where(models.User.id == order.user_id, models.User.points >= order.points_used)
+        .values(
+            points=models.User.points - order.points_used + points_earned,
+            lifetime_points=new_lifetime,
+            level_name=level_name_expr(new_lifetime),
+        )
+        .returning(models.User.id)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if updated is None:
+        db.rollback()
+        if get_user(db, order.user_id) is None:
+            # Should we auto-create? For now assume sync happened.
+            return None
+        raise InsufficientPointsError(f"User {order.user_id} has fewer than {order.points_used} points")
+
+    # 3. Create Order Record (same transaction as the points update)
     db_order = models.Order(
-        id=order_id,
+        id=order_ids.next_order_id(db),
         user_id=order.user_id,
         total_price=order.total_price,
         points_used=order.points_used,
@@ -102,17 +138,129 @@ def create_order(db: Session, order: schemas.OrderCreate):
     )
     
     db.add(db_order)
+    cache_bus.notify(db, "user", [order.user_id])
     db.commit()
     db.refresh(db_order)
+    # Points changed; the next read reloads the row
+    user_cache.evict(order.user_id)
     
     return db_order
 
+def create_orders_batch(db: Session, orders: list[schemas.OrderCreate]) -> list[dict]:
+    """Create many orders in one transaction, with per-order results.
+
+    Orders are applied in list order; one that fails (unknown user, not enough
+    points) is reported and skipped without affecting the rest.
+    """
+    user_ids = sorted({order.user_id for order in orders})
+    # Lock every affected user up front, in id order so concurrent batches can't deadlock
+    rows = db.execute(
+        select(models.User.id, models.User.points, models.User.lifetime_points)
+        .where(models.User.id.in_(user_ids))
+        .order_by(models.User.id)
+        .with_for_update()
+    ).all()
+    balances = {row.id: [row.points, row.lifetime_points] for row in rows}
+
+    results: list[dict] = []
+    accepted = []
+    for index, order in enumerate(orders):
+        balance = balances.get(order.user_id)
+        if balance is None:
+            results.append({"index": index, "ok": False, "error": "User not found"})
+            continue
+        if balance[0] < order.points_used:
+            results.append({"index": index, "ok": False, "error": "Not enough points"})
+            continue
+        points_earned = calculate_points_earned(order)
+        balance[0] += points_earned - order.points_used
+        balance[1] += points_earned
+        result = {"index": index, "ok": True}
+        results.append(result)
+        accepted.append((result, order, points_earned))
+
+    if accepted:
+        created_at = datetime.datetime.utcnow()
+        order_rows = []
+        for (result, order, points_earned), order_id in zip(accepted, order_ids.next_order_ids(db, len(accepted))):
+            row = dict(order.model_dump(), id=order_id, points_earned=points_earned, created_at=created_at)
+            order_rows.append(row)
+            result["order"] = row
+        db.execute(insert(models.Order), order_rows)
+
+        touched = {order.user_id for _, order, _ in accepted}
+        db.execute(update(models.User), [
+            {
+                "id": user_id,
+                "points": balances[user_id][0],
+                "lifetime_points": balances[user_id][1],
+                "level_name": utils.calculate_user_level(balances[user_id][1])[0],
+            }
+            for user_id in touched
+        ])
+        cache_bus.notify(db, "user", touched)
+        db.commit()
+        for user_id in touched:
+            user_cache.evict(user_id)
+    else:
+        db.rollback()  # Release the row locks
+
+    return results
+
+# --- Order history ---
+ORDER_SUMMARY_COLUMNS = (
+    models.Order.id,
+    models.Order.items_summary,
+    models.Order.total_price,
+    models.Order.points_used,
+    models.Order.points_earned,
+    models.Order.pickup_time,
+    models.Order.created_at,
+)
+
+def encode_order_cursor(created_at: datetime.datetime, order_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{order_id}".encode()).decode()
+
+def decode_order_cursor(cursor: str):
+    """(created_at, order_id); raises ValueError for malformed cursors"""
+    created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    return datetime.datetime.fromisoformat(created_at), order_id
+
+def get_user_orders(db: Session, user_id: int, limit: int = 20, cursor: str = None) -> dict:
+    """One page of a user's orders, newest first.
+
+    Keyset pagination on (created_at, id) over ix_orders_user_id_created_at_id,
+    so deep pages cost the same as the first one.
+    """
+    query = db.query(*ORDER_SUMMARY_COLUMNS).filter(models.Order.user_id == user_id)
+    if cursor:
+        query = query.filter(tuple_(models.Order.created_at, models.Order.id) < decode_order_cursor(cursor))
+    rows = (
+        query.order_by(models.Order.created_at.desc(), models.Order.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_order_cursor(rows[-1].created_at, rows[-1].id)
+    return {"orders": [row._asdict() for row in rows], "next_cursor": next_cursor}
+
 # ============= PHASE 3: MENU CRUD =============
 
 # --- Categories ---
 def get_categories(db: Session):
     return db.query(models.Category).order_by(models.Category.sort_order).all()
 
+def get_menu(db: Session):
+    """Full Category -> Product -> Modifier tree in 3 queries, however big the menu is"""
+    return (
+        db.query(models.Category)
+        .options(selectinload(models.Category.products).selectinload(models.Product.modifiers))
+        .order_by(models.Category.sort_order)
+        .all()
+    )
+
 def get_category(db: Session, category_id: str):
     return db.query(models.Category).filter(models.Category.id == category_id).first()
 
@@ -123,6 +271,7 @@ def create_category(db: Session, category: schemas.CategoryCreate):
         sort_order=category.sort_order
     )
     db.add(db_category)
+    cache_bus.notify(db, "menu")
     db.commit()
     db.refresh(db_category)
     return db_category
@@ -134,6 +283,7 @@ def update_category(db: Session, category_id: str, category_update: schemas.Cate
             db_category.name = category_update.name
         if category_update.sort_order is not None:
             db_category.sort_order = category_update.sort_order
+        cache_bus.notify(db, "menu")
         db.commit()
         db.refresh(db_category)
     return db_category
@@ -142,6 +292,7 @@ def delete_category(db: Session, category_id: str):
     db_category = get_category(db, category_id)
     if db_category:
         db.delete(db_category)
+        cache_bus.notify(db, "menu")
         db.commit()
         return True
     return False
@@ -164,24 +315,21 @@ def create_product(db: Session, product: schemas.ProductCreate):
         category_id=product.category_id,
         image_url=product.image_url,
         video_url=product.video_url,
-        sort_order=product.sort_order
-    )
-    db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
-    
-    # Add modifiers if provided
-    if product.modifiers:
-        for mod in product.modifiers:
-            db_mod = models.ProductModifier(
-                product_id=db_product.id,
+        sort_order=product.sort_order,
+        # Inserted with the product, in the same commit
+        modifiers=[
+            models.ProductModifier(
                 modifier_type=mod.modifier_type,
                 name=mod.name,
                 price=mod.price
             )
-            db.add(db_mod)
-        db.commit()
-        db.refresh(db_product)
+            for mod in product.modifiers or []
+        ]
+    )
+    db.add(db_product)
+    cache_bus.notify(db, "menu")
+    db.commit()
+    db.refresh(db_product)
     
     return db_product
 
@@ -202,6 +350,7 @@ def update_product(db: Session, product_id: int, product_update: schemas.Product
             db_product.video_url = product_update.video_url
         if product_update.sort_order is not None:
             db_product.sort_order = product_update.sort_order
+        cache_bus.notify(db, "menu")
         db.commit()
         db.refresh(db_product)
     return db_product
@@ -210,6 +359,7 @@ def delete_product(db: Session, product_id: int):
     db_product = get_product(db, product_id)
     if db_product:
         db.delete(db_product)
+        cache_bus.notify(db, "menu")
         db.commit()
         return True
     return False
@@ -218,6 +368,7 @@ def delete_product(db: Session, product_id: int):
 def add_modifier(db: Session, product_id: int, modifier: schemas.ModifierCreate):
     db_mod = models.ProductModifier(**modifier.model_dump(), product_id=product_id)
     db.add(db_mod)
+    cache_bus.notify(db, "menu")
     db.commit()
     db.refresh(db_mod)
     return db_mod
@@ -226,10 +377,150 @@ def delete_modifier(db: Session, modifier_id: int):
     db_mod = db.query(models.ProductModifier).filter(models.ProductModifier.id == modifier_id).first()
     if db_mod:
         db.delete(db_mod)
+        cache_bus.notify(db, "menu")
         db.commit()
         return True
     return False
 
+# --- Bulk menu sync ---
+def _changed(row, values: dict) -> bool:
+    return any(getattr(row, key) != value for key, value in values.items())
+
+def _by_key(rows, key) -> dict:
+    """key -> rows with that key, oldest (lowest id) first"""
+    grouped = {}
+    for row in sorted(rows, key=lambda r: r.id):
+        grouped.setdefault(key(row), []).append(row)
+    return grouped
+
+def _first_unmatched(candidates, matched: set):
+    return next((row for row in candidates if row.id not in matched), None)
+
+def delete_products(db: Session, product_ids: list):
+    """Bulk-delete products and the favorites pointing at them, without committing.
+    Their modifiers must be deleted first."""
+    db.execute(
+        delete(models.Favorite)
+        .where(models.Favorite.product_id.in_(product_ids))
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(
+        delete(models.Product)
+        .where(models.Product.id.in_(product_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+def sync_menu(db: Session, menu: schemas.MenuSync, prune: bool = True) -> dict:
+    """Make the stored menu match `menu` with bulk statements and one commit.
+
+    Products and modifiers are matched by id when given, otherwise by
+    (category, name) / (type, name), so re-importing the same data is a no-op.
+    Repeated names are matched by position: the n-th such entry gets the n-th
+    oldest row with that name.
+    With prune=False nothing missing from `menu` is deleted (upsert only).
+    Returns inserted/updated/deleted counts per table.
+    """
+    current = get_menu(db)
+    current_categories = {c.id: c for c in current}
+    current_products = {p.id: p for c in current for p in c.products}
+    products_by_key = _by_key(current_products.values(), lambda p: (p.category_id, p.name))
+
+    category_inserts, category_updates = [], []
+    product_inserts, product_updates = [], []  # inserts: (row, modifiers)
+    modifier_inserts, modifier_updates = [], []
+    kept_products, kept_modifiers = set(), set()
+
+    for category in menu.categories:
+        values = {"name": category.name, "sort_order": category.sort_order}
+        existing_category = current_categories.get(category.id)
+        if existing_category is None:
+            category_inserts.append(dict(values, id=category.id))
+        elif _changed(existing_category, values):
+            category_updates.append(dict(values, id=category.id))
+
+        for product in category.products:
+            values = product.model_dump(exclude={"id", "modifiers"})
+            values["category_id"] = category.id
+            if product.id is not None:
+                existing = current_products.get(product.id)
+            else:
+                existing = _first_unmatched(products_by_key.get((category.id, product.name), ()), kept_products)
+            if existing is None or existing.id in kept_products:
+                product_inserts.append((values, product.modifiers))
+                continue
+            kept_products.add(existing.id)
+            if _changed(existing, values):
+                product_updates.append(dict(values, id=existing.id))
+
+            modifiers_by_id = {m.id: m for m in existing.modifiers}
+            modifiers_by_key = _by_key(existing.modifiers, lambda m: (m.modifier_type, m.name))
+            for modifier in product.modifiers:
+                values = modifier.model_dump(exclude={"id"})
+                if modifier.id is not None:
+                    existing_modifier = modifiers_by_id.get(modifier.id)
+                else:
+                    existing_modifier = _first_unmatched(
+                        modifiers_by_key.get((modifier.modifier_type, modifier.name), ()), kept_modifiers
+                    )
+                if existing_modifier is None or existing_modifier.id in kept_modifiers:
+                    modifier_inserts.append(dict(values, product_id=existing.id))
+                    continue
+                kept_modifiers.add(existing_modifier.id)
+                if _changed(existing_modifier, values):
+                    modifier_updates.append(dict(values, id=existing_modifier.id))
+
+    category_deletes, product_deletes, modifier_deletes = [], [], []
+    if prune:
+        wanted_categories = {c.id for c in menu.categories}
+        category_deletes = [c for c in current_categories if c not in wanted_categories]
+        product_deletes = [p for p in current_products if p not in kept_products]
+        modifier_deletes = [
+            m.id for p in current_products.values() for m in p.modifiers if m.id not in kept_modifiers
+        ]
+
+    # Order matters for foreign keys: parents are inserted first and deleted last
+    if category_inserts:
+        db.execute(insert(models.Category), category_inserts)
+    if category_updates:
+        db.execute(update(models.Category), category_updates)
+    if modifier_deletes:
+        db.execute(
+            delete(models.ProductModifier)
+            .where(models.ProductModifier.id.in_(modifier_deletes))
+            .execution_options(synchronize_session=False)
+        )
+    if product_deletes:
+        delete_products(db, product_deletes)
+    if product_updates:
+        db.execute(update(models.Product), product_updates)
+    if product_inserts:
+        new_ids = db.execute(
+            insert(models.Product).returning(models.Product.id, sort_by_parameter_order=True),
+            [values for values, _ in product_inserts],
+        ).scalars().all()
+        for product_id, (_, modifiers) in zip(new_ids, product_inserts):
+            modifier_inserts.extend(
+                dict(m.model_dump(exclude={"id"}), product_id=product_id) for m in modifiers
+            )
+    if modifier_inserts:
+        db.execute(insert(models.ProductModifier), modifier_inserts)
+    if modifier_updates:
+        db.execute(update(models.ProductModifier), modifier_updates)
+    if category_deletes:
+        db.execute(
+            delete(models.Category)
+            .where(models.Category.id.in_(category_deletes))
+            .execution_options(synchronize_session=False)
+        )
+    cache_bus.notify(db, "menu")
+    db.commit()
+
+    return {
+        "categories": {"inserted": len(category_inserts), "updated": len(category_updates), "deleted": len(category_deletes)},
+        "products": {"inserted": len(product_inserts), "updated": len(product_updates), "deleted": len(product_deletes)},
+        "modifiers": {"inserted": len(modifier_inserts), "updated": len(modifier_updates), "deleted": len(modifier_deletes)},
+    }
+
 # --- Favorites ---
 def get_user_favorites(db: Session, user_id: int):
     return [
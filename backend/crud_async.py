@@ -0,0 +1,77 @@
+"""Awaitable versions of the crud functions for the async route handlers.
+
+With DB_ASYNC=1 each call runs the sync crud code on the AsyncSession's
+connection via AsyncSession.run_sync (greenlet, no threads). Otherwise it
+falls back to the regular Session in Starlette's thread pool, which is what
+sync `def` handlers did before.
+
+Functions that return ORM rows with relationships are converted to their
+schema inside the call, because lazy loads cannot run once we are back on
+the event loop.
+"""
+import functools
+
+from starlette.concurrency import run_in_threadpool
+
+import crud, schemas
+from database import DB_ASYNC
+from user_cache import user_cache
+
+
+async def run(db, fn, *args, **kwargs):
+    """Run fn(session, *args, **kwargs) against db without blocking the event loop"""
+    if DB_ASYNC:
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def _awaitable(fn, schema=None):
+    def call(session, *args, **kwargs):
+        result = fn(session, *args, **kwargs)
+        if schema is not None and result is not None:
+            result = schema.model_validate(result)
+        return result
+
+    @functools.wraps(fn)
+    async def wrapper(db, *args, **kwargs):
+        return await run(db, call, *args, **kwargs)
+    return wrapper
+
+
+# --- Users & Orders ---
+get_user = _awaitable(crud.get_user, schemas.User)
+
+async def get_user_cached(db, user_id: int):
+    # Cache hits skip the thread pool / greenlet hop entirely
+    cached = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+    return await run(db, crud.get_user_cached, user_id)
+
+create_user = _awaitable(crud.create_user, schemas.User)
+update_user_profile = _awaitable(crud.update_user_profile, schemas.User)
+update_user_points = _awaitable(crud.update_user_points, schemas.User)
+create_order = _awaitable(crud.create_order, schemas.Order)
+create_orders_batch = _awaitable(crud.create_orders_batch)
+get_user_orders = _awaitable(crud.get_user_orders)
+
+# --- Menu ---
+get_categories = _awaitable(crud.get_categories)
+get_menu = _awaitable(crud.get_menu)
+get_category = _awaitable(crud.get_category)
+create_category = _awaitable(crud.create_category, schemas.Category)
+update_category = _awaitable(crud.update_category, schemas.Category)
+delete_category = _awaitable(crud.delete_category)
+get_products = _awaitable(crud.get_products)
+get_product = _awaitable(crud.get_product)
+create_product = _awaitable(crud.create_product, schemas.Product)
+update_product = _awaitable(crud.update_product, schemas.Product)
+delete_product = _awaitable(crud.delete_product)
+add_modifier = _awaitable(crud.add_modifier, schemas.Modifier)
+delete_modifier = _awaitable(crud.delete_modifier)
+sync_menu = _awaitable(crud.sync_menu)
+
+# --- Favorites ---
+get_user_favorites = _awaitable(crud.get_user_favorites)
+add_favorite = _awaitable(crud.add_favorite, schemas.Favorite)
+remove_favorite = _awaitable(crud.remove_favorite)
@@ -1,31 +1,103 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
 import os
+import threading
 from dotenv import load_dotenv
+import db_pool
 
-# Load .env file explicitly
+# Load .env file explicitly (a local file read; other modules read their
+# settings from the environment when imported)
 load_dotenv()
 
-# Get DATABASE_URL
-SQLALCHEMY_DATABASE_URL = os.getenv('DATABASE_URL')
+# Optional async mode (DB_ASYNC=1): route handlers get an AsyncSession on asyncpg
+# instead of a sync Session, so DB waits no longer hold thread-pool slots.
+DB_ASYNC = os.getenv('DB_ASYNC', '0').lower() in ('1', 'true', 'yes')
 
-if not SQLALCHEMY_DATABASE_URL:
-    raise ValueError('DATABASE_URL environment variable is not set. Please ensure .env file exists and contains DATABASE_URL.')
+def get_database_url() -> str:
+    url = os.getenv('DATABASE_URL')
+    if not url:
+        raise ValueError('DATABASE_URL environment variable is not set. Please ensure .env file exists and contains DATABASE_URL.')
+    # Handle Postgres URL format for SQLAlchemy (postgres:// -> postgresql://)
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return url
 
-# Handle Postgres URL format for SQLAlchemy (postgres:// -> postgresql://)
-if SQLALCHEMY_DATABASE_URL.startswith('postgres://'):
-    SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+def get_async_database_url(url: str) -> str:
+    """Same database, async driver (postgresql:// -> postgresql+asyncpg://)"""
+    scheme, rest = url.split('://', 1)
+    dialect = scheme.split('+', 1)[0]
+    driver = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}.get(dialect)
+    if driver is None:
+        raise ValueError(f'DB_ASYNC is not supported for {dialect} databases')
+    return f'{dialect}+{driver}://{rest}'
 
-# SQLite fallback REMOVED. Strict Postgres mode.
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+DbSession = Session  # What get_db yields
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    DbSession = AsyncSession
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Engines are created on first use, not on import: `import main` (tests,
+# tooling, worker boot) needs neither DATABASE_URL nor the driver, and the
+# first connection is made by the lifespan. `database.engine` and
+# `from database import engine` still work through __getattr__ below.
+_engines = {}
+_engines_lock = threading.Lock()
+
+def _create_engines():
+    url = get_database_url()
+    # SQLite fallback REMOVED. Strict Postgres mode.
+    engine = create_engine(url, **db_pool.engine_kwargs())
+    created = {
+        'SQLALCHEMY_DATABASE_URL': url,
+        'engine': engine,
+        'SessionLocal': sessionmaker(autocommit=False, autoflush=False, bind=engine),
+        'async_engine': None,
+        'AsyncSessionLocal': None,
+    }
+    if DB_ASYNC:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+        created['async_engine'] = create_async_engine(
+            get_async_database_url(url), **db_pool.engine_kwargs(is_async=True)
+        )
+        # Objects are returned to handlers after commit, where lazy refreshes can't run
+        created['AsyncSessionLocal'] = async_sessionmaker(created['async_engine'], autoflush=False, expire_on_commit=False)
+    return created
+
+def _get(name: str):
+    if not _engines:
+        with _engines_lock:
+            if not _engines:
+                _engines.update(_create_engines())
+    return _engines[name]
+
+_LAZY = ('SQLALCHEMY_DATABASE_URL', 'engine', 'SessionLocal', 'async_engine', 'AsyncSessionLocal')
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        return _get(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+async def dispose():
+    """Close pooled connections (lifespan shutdown); nothing to do if no engine was created"""
+    if not _engines:
+        return
+    if _engines['async_engine'] is not None:
+        await _engines['async_engine'].dispose()
+    _engines['engine'].dispose()
+
+if DB_ASYNC:
+    async def get_db():
+        async with _get('AsyncSessionLocal')() as db:
+            yield db
+else:
+    def get_db():
+        db = _get('SessionLocal')()
+        try:
+            yield db
+        finally:
+            db.close()
@@ -0,0 +1,106 @@
+"""Connection pool settings and live pool statistics.
+
+Pool sizing comes from the environment so it can be tuned per deployment
+(workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) must stay under Postgres
+max_connections):
+
+    DB_POOL_SIZE       persistent connections per worker (default 5)
+    DB_MAX_OVERFLOW    extra connections under load, -1 = unlimited (default 10)
+    DB_POOL_TIMEOUT    seconds to wait for a free connection (default 30)
+    DB_POOL_PRE_PING   test connections before use (default off)
+    DB_POOL_RECYCLE    max connection age in seconds, -1 = never (default -1)
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes')
+
+
+class PoolStats:
+    """Checkout counters; a "wait" is a checkout that found no idle connection and no overflow room"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.timeouts = 0
+
+    def record(self, waited: bool, elapsed: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_time_total += elapsed
+                self.wait_time_max = max(self.wait_time_max, elapsed)
+
+
+class _InstrumentedMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        waited = self._pool.empty() and 0 <= self._max_overflow <= self._overflow
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record(True, time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record(waited, time.perf_counter() - start)
+        return conn
+
+
+class InstrumentedQueuePool(_InstrumentedMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncPool(_InstrumentedMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_kwargs(is_async: bool = False) -> dict:
+    """create_engine()/create_async_engine() pool arguments from the environment"""
+    return {
+        'poolclass': InstrumentedAsyncPool if is_async else InstrumentedQueuePool,
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', False),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '-1')),
+    }
+
+
+def pool_status(pool) -> dict:
+    status = {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+        'max_overflow': pool._max_overflow,
+        'timeout': pool.timeout(),
+    }
+    stats = getattr(pool, 'stats', None)
+    if stats is not None:
+        status.update(
+            checkouts=stats.checkouts,
+            waits=stats.waits,
+            wait_time_total=round(stats.wait_time_total, 6),
+            wait_time_max=round(stats.wait_time_max, 6),
+            timeouts=stats.timeouts,
+        )
+    return status
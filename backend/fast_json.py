@@ -0,0 +1,66 @@
+"""
+Opt-in fast JSON for the read-heavy endpoints (FAST_JSON=1).
+
+ORM rows are trusted, so instead of validating them into pydantic models and
+dumping those, they are copied into plain dicts following the response
+schema's field list and encoded with orjson (stdlib json when it isn't
+installed). The bytes are the same as model_dump_json(), so ETags don't
+change, and the routes keep their response_model for the OpenAPI schema.
+"""
+import json
+import os
+import typing
+from functools import lru_cache
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # Optional: stdlib json
+    orjson = None
+
+ENABLED = os.getenv("FAST_JSON", "0").lower() in ("1", "true", "yes")
+
+
+def dumps(obj) -> bytes:
+    """Compact UTF-8 JSON, as pydantic writes it"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+@lru_cache(maxsize=None)
+def _plan(model: typing.Type[BaseModel]) -> tuple:
+    """(field name, plan of the nested model for list[Model] fields or None)"""
+    plan = []
+    for name, field in model.model_fields.items():
+        nested = None
+        if typing.get_origin(field.annotation) is list:
+            (item,) = typing.get_args(field.annotation)
+            if isinstance(item, type) and issubclass(item, BaseModel):
+                nested = _plan(item)
+        plan.append((name, nested))
+    return tuple(plan)
+
+
+def _convert(obj, plan: tuple) -> dict:
+    out = {}
+    for name, nested in plan:
+        value = getattr(obj, name)
+        if nested is not None:
+            value = [_convert(item, nested) for item in value]
+        out[name] = value
+    return out
+
+
+def to_dict(obj, model: typing.Type[BaseModel]) -> dict:
+    """model's fields read from obj (an ORM row), without validation"""
+    plan = _plan(model)
+    if type(obj) is model and not any(nested for _, nested in plan):
+        return obj.__dict__  # Already a validated instance (e.g. from user_cache)
+    return _convert(obj, plan)
+
+
+def to_list(objs, model: typing.Type[BaseModel]) -> list:
+    plan = _plan(model)
+    return [_convert(obj, plan) for obj in objs]
@@ -0,0 +1,292 @@
+"""
+Synthetic dataset for capacity testing (Postgres only).
+
+Generates users, a menu, orders and favorites with production-like skew and
+streams them into the tables with COPY (pg_copy). A small share of users
+places most orders and a few products collect most orders and favorites;
+order timestamps are spread over --days and increase with the order id, as
+with real ORD-<sequence> ids.
+
+Output is deterministic for a given --seed and --chunk-size: every chunk gets
+its own random.Random seeded from (seed, table, chunk), so the result doesn't
+depend on --jobs or on chunk scheduling.
+
+Foreign keys and non-unique indexes of users/orders/favorites are dropped
+during the load and rebuilt once at the end (also if the load fails).
+
+Usage:
+    python generate_dataset.py --truncate                              # defaults below
+    python generate_dataset.py --truncate --users 1000000 --orders 20000000 \\
+        --products 500 --favorites 5000000 --jobs 8
+
+Refuses to run on a database that already has users unless --truncate is
+given (which empties every app table).
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+from multiprocessing import Pool
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import engine
+import migrations
+import recompute_levels
+import seed_menu
+from pg_copy import copy_rows, reset_serial
+
+USER_ID_BASE = 10_000_000_000  # Above real Telegram ids
+ORDER_NUMBER_BASE = 10_000_000  # order_number_seq start, see models.py
+CHUNK_SIZE = 100_000
+
+MODIFIER_OPTIONS = {
+    "size": [("S", 0), ("M", 40), ("L", 80)],
+    "milk": [("Овсяное", 60), ("Миндальное", 70), ("Кокосовое", 70), ("Безлактозное", 50)],
+    "syrup": [("Карамель", 40), ("Ваниль", 40), ("Лесной орех", 40), ("Солёная карамель", 50)],
+}
+FIRST_NAMES = ["Алексей", "Мария", "Иван", "Анна", "Дмитрий", "Елена", "Сергей", "Ольга", "Никита", "Дарья"]
+PICKUP_TIMES = ["Как можно скорее", "Через 10 минут", "Через 15 минут", "Через 30 минут"]
+
+
+def skewed_index(rng: random.Random, n: int, skew: float) -> int:
+    """Index in [0, n) where low indexes are much more likely (power law, skew > 1)"""
+    return min(int(n * rng.random() ** skew), n - 1)
+
+
+def chunk_rng(seed: int, table: str, chunk: int) -> random.Random:
+    return random.Random(f"{seed}:{table}:{chunk}")
+
+
+# --- Menu (small, generated in the parent) ---
+def build_catalog(seed: int, product_count: int) -> dict:
+    rng = chunk_rng(seed, "menu", 0)
+    categories = [(c["id"], c["name"], c["sort_order"]) for c in seed_menu.CATEGORIES]
+    templates = seed_menu.PRODUCTS
+    products, modifiers = [], []
+    for i in range(product_count):
+        template = templates[i % len(templates)]
+        product_id = i + 1
+        name = template["name"] if i < len(templates) else f"{template['name']} #{i // len(templates) + 1}"
+        price = max(50, template["price"] + rng.randrange(-50, 60, 10))
+        products.append((
+            product_id, name, template.get("description"), price, template["category_id"],
+            template.get("image_url"), template.get("video_url"), i,
+        ))
+        for modifier_type, options in MODIFIER_OPTIONS.items():
+            if rng.random() < 0.5:
+                for option_name, option_price in rng.sample(options, rng.randint(1, len(options))):
+                    modifiers.append((len(modifiers) + 1, product_id, modifier_type, option_name, option_price))
+    return {"categories": categories, "products": products, "modifiers": modifiers}
+
+
+# --- Chunk generators (run in worker processes) ---
+def user_rows(args, catalog: dict, chunk: int, start: int, count: int):
+    rng = chunk_rng(args.seed, "users", chunk)
+    lifetime = [int(rng.lognormvariate(5.5, 1.2)) for _ in range(count)]
+    levels = recompute_levels.level_names_for(lifetime)
+    for i in range(count):
+        n = start + i
+        yield (
+            USER_ID_BASE + n,
+            f"{rng.choice(FIRST_NAMES)} {n}",
+            None if rng.random() < 0.7 else f"https://t.me/i/userpic/{n}.jpg",
+            rng.randint(0, lifetime[i]),
+            lifetime[i],
+            levels[i],
+            False,
+        )
+
+
+def order_rows(args, catalog: dict, chunk: int, start: int, count: int):
+    rng = chunk_rng(args.seed, "orders", chunk)
+    products = catalog["products"]
+    span = args.days * 86400
+    end = datetime.datetime.fromisoformat(args.end)
+    first = end - datetime.timedelta(days=args.days)
+    for i in range(count):
+        n = start + i
+        items, total = [], 0
+        for _ in range(rng.choice((1, 1, 1, 2, 2, 3))):
+            product = products[skewed_index(rng, len(products), args.skew)]
+            quantity = 1 if rng.random() < 0.85 else 2
+            items.append(f"{product[1]} x{quantity}")
+            total += product[3] * quantity
+        points_used = 0 if rng.random() < 0.85 else min(total, rng.randrange(10, 210, 10))
+        yield (
+            f"ORD-{ORDER_NUMBER_BASE + n}",
+            USER_ID_BASE + skewed_index(rng, args.users, args.skew),
+            total,
+            points_used,
+            int(total * 0.05) if points_used == 0 else 0,  # crud.calculate_points_earned
+            ", ".join(items),
+            first + datetime.timedelta(seconds=(n + rng.random()) * span / args.orders),
+            None if rng.random() < 0.9 else "Без сахара",
+            rng.choice(PICKUP_TIMES) if rng.random() < 0.6 else None,
+        )
+
+
+def favorite_rows(args, catalog: dict, chunk: int, start: int, count: int):
+    """Favorites of users [start, start + count); per-user counts average favorites/users"""
+    rng = chunk_rng(args.seed, "favorites", chunk)
+    product_count = len(catalog["products"])
+    mean = args.favorites / args.users
+    span = args.days * 86400
+    end = datetime.datetime.fromisoformat(args.end)
+    for n in range(start, start + count):
+        k = min(int(rng.expovariate(1 / mean) + 0.5), product_count // 2) if mean > 0 else 0
+        chosen = set()
+        while len(chosen) < k:
+            chosen.add(skewed_index(rng, product_count, args.skew) + 1)
+        for product_id in sorted(chosen):
+            yield (USER_ID_BASE + n, product_id, end - datetime.timedelta(seconds=rng.random() * span))
+
+
+TABLES = {
+    "users": (["id", "name", "avatar_url", "points", "lifetime_points", "level_name", "is_admin"], user_rows),
+    "orders": (
+        ["id", "user_id", "total_price", "points_used", "points_earned", "items_summary", "created_at",
+         "comment", "pickup_time"],
+        order_rows,
+    ),
+    "favorites": (["user_id", "product_id", "created_at"], favorite_rows),
+}
+
+_worker = {}
+
+
+def _init_worker(dsn: str, args, catalog: dict):
+    _worker.update(conn=psycopg2.connect(dsn), args=args, catalog=catalog)
+
+
+def load_chunk(task: tuple) -> tuple:
+    table, chunk, start, count = task
+    conn, args = _worker["conn"], _worker["args"]
+    columns, generate = TABLES[table]
+    with conn.cursor() as cur:
+        copied = copy_rows(cur, table, columns, generate(args, _worker["catalog"], chunk, start, count))
+    conn.commit()
+    return table, copied
+
+
+def tasks(table: str, total: int, chunk_size: int) -> list:
+    return [(table, i, start, min(chunk_size, total - start)) for i, start in enumerate(range(0, total, chunk_size))]
+
+
+# --- Driver ---
+BULK_TABLES = ["users", "orders", "favorites"]
+
+
+def drop_secondary_objects(cur, tables: list) -> list:
+    """Drop foreign keys and non-unique indexes on tables, returns the DDL that recreates them.
+
+    Checking a foreign key and updating every index per copied row is most of
+    the COPY time; validating/building them once at the end is much faster.
+    """
+    cur.execute(
+        "SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE contype = 'f' AND conrelid = ANY(%s::regclass[])",
+        (tables,),
+    )
+    foreign_keys = cur.fetchall()
+    cur.execute(
+        "SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid) FROM pg_index "
+        "WHERE indrelid = ANY(%s::regclass[]) AND NOT indisunique",
+        (tables,),
+    )
+    indexes = cur.fetchall()
+    for table, name, _ in foreign_keys:
+        cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+    for name, _ in indexes:
+        cur.execute(f"DROP INDEX {name}")
+    return [definition for _, definition in indexes] + [
+        f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}" for table, name, definition in foreign_keys
+    ]
+
+
+def generate(args):
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("generate_dataset.py needs Postgres (COPY); set DATABASE_URL")
+    migrations.upgrade(engine)
+    engine.dispose()  # Forked workers must not inherit pooled connections
+    dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+    started = time.perf_counter()
+
+    conn = psycopg2.connect(dsn)
+    with conn.cursor() as cur:
+        if args.truncate:
+            cur.execute("TRUNCATE favorites, orders, product_modifiers, products, categories, users RESTART IDENTITY")
+        else:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM users)")
+            if cur.fetchone()[0]:
+                raise SystemExit("users is not empty; rerun with --truncate to replace all app data")
+
+        catalog = build_catalog(args.seed, args.products)
+        copy_rows(cur, "categories", ["id", "name", "sort_order"], catalog["categories"])
+        copy_rows(cur, "products", ["id", "name", "description", "price", "category_id", "image_url", "video_url",
+                                    "sort_order"], catalog["products"])
+        copy_rows(cur, "product_modifiers", ["id", "product_id", "modifier_type", "name", "price"],
+                  catalog["modifiers"])
+        reset_serial(cur, "products")
+        reset_serial(cur, "product_modifiers")
+    conn.commit()
+    print(f"Menu: {len(catalog['categories'])} categories, {len(catalog['products'])} products, "
+          f"{len(catalog['modifiers'])} modifiers")
+
+    with conn.cursor() as cur:
+        recreate = drop_secondary_objects(cur, BULK_TABLES)
+    conn.commit()
+    try:
+        with Pool(args.jobs, initializer=_init_worker, initargs=(dsn, args, catalog)) as pool:
+            # Users first, then orders and favorites for them
+            for phase in (["users"], ["orders", "favorites"]):
+                work = []
+                for table in phase:
+                    # Favorites are generated per user range
+                    total = args.users if table in ("users", "favorites") else args.orders
+                    work += tasks(table, total, args.chunk_size)
+                counts = {table: 0 for table in phase}
+                for table, copied in pool.imap_unordered(load_chunk, work):
+                    counts[table] += copied
+                for table, copied in counts.items():
+                    print(f"  {table}: {copied} rows ({time.perf_counter() - started:.0f}s)")
+    finally:
+        # Also after a failure: the schema must not be left without its indexes/foreign keys
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("SET maintenance_work_mem = '512MB'")
+            for statement in recreate:
+                cur.execute(statement)
+        conn.commit()
+        print(f"  indexes and foreign keys rebuilt ({time.perf_counter() - started:.0f}s)")
+
+    if args.orders:
+        with conn.cursor() as cur:
+            # The app's next ORD-<n> must come after the generated ones
+            cur.execute("SELECT setval('order_number_seq', %s)", (ORDER_NUMBER_BASE + args.orders - 1,))
+        conn.commit()
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE")
+    conn.close()
+    print(f"Done in {time.perf_counter() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a large synthetic dataset into Postgres")
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--orders", type=int, default=2_000_000)
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--favorites", type=int, default=500_000, help="approximate total")
+    parser.add_argument("--days", type=int, default=730, help="order history span")
+    parser.add_argument("--end", default="2026-01-01", help="newest order date (fixed for reproducibility)")
+    parser.add_argument("--skew", type=float, default=2.0, help="power-law exponent for user/product popularity")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="parallel COPY workers")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--truncate", action="store_true", help="empty all app tables first")
+    generate(parser.parse_args())
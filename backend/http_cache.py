@@ -0,0 +1,41 @@
+import hashlib
+from typing import Callable
+
+from fastapi import Request, Response
+
+
+def make_etag(data: bytes) -> str:
+    """Strong ETag from a content hash"""
+    return '"%s"' % hashlib.sha256(data).hexdigest()[:32]
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so W/"x" matches "x"
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def conditional_json(
+    request: Request,
+    etag: str,
+    build_body: Callable[[], bytes],
+    cache_control: str = "no-cache",
+) -> Response:
+    """304 if the client already has this version, otherwise the JSON body.
+
+    build_body is only called when the body is actually sent.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=build_body(), media_type="application/json", headers=headers)
@@ -0,0 +1,171 @@
+"""
+Resized WebP/AVIF variants of the images in public/images.
+
+A request for /images/<name>?w=<width> gets the source image resized to the
+nearest width in WIDTHS (never upscaled), in the best format the client's
+Accept header allows (AVIF, then WebP, else the original file). Variants are
+written to IMAGE_CACHE_DIR on first request, named after a hash of the source
+bytes, so replacing an image never serves a stale variant. They can also be
+generated ahead of time:
+
+    python image_variants.py [images_dir]
+
+Pillow is optional: without it the originals are served as before.
+"""
+import hashlib
+import os
+import sys
+import threading
+from functools import lru_cache
+from typing import Optional
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(BASE_DIR, "static", "image_cache"))
+
+WIDTHS = (160, 320, 480, 640, 960, 1280)
+DEFAULT_WIDTH = WIDTHS[-1]
+SOURCE_EXTENSIONS = {".png", ".jpg", ".jpeg"}
+
+# Bump when encoder settings change, so old variants are not reused
+PIPELINE_VERSION = 1
+
+# (media type, Pillow format, extension, save options), best first
+ALL_FORMATS = (
+    ("image/avif", "AVIF", ".avif", {"quality": 55, "speed": 6}),
+    ("image/webp", "WEBP", ".webp", {"quality": 78, "method": 6}),
+)
+
+_hashes = {}  # (path, mtime_ns, size) -> source hash
+_ready = set()  # Variant paths known to exist on disk
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def formats() -> tuple:
+    """ALL_FORMATS this Pillow build can encode; Pillow is imported on first use, not at startup"""
+    try:
+        from PIL import features
+    except ImportError:  # Optional: originals only
+        return ()
+    return tuple(f for f in ALL_FORMATS if features.check(f[1].lower()))
+
+
+def enabled() -> bool:
+    return bool(formats())
+
+
+def snap_width(width: Optional[int]) -> int:
+    """Smallest configured width >= width (so the cache stays small)"""
+    if not width:
+        return DEFAULT_WIDTH
+    for candidate in WIDTHS:
+        if candidate >= width:
+            return candidate
+    return WIDTHS[-1]
+
+
+def media_ranges(accept: str) -> dict:
+    """media range -> q-value from an Accept header (a malformed q counts as 0)"""
+    ranges = {}
+    for part in accept.lower().split(","):
+        media_range, *params = part.split(";")
+        q = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        media_range = media_range.strip()
+        if media_range:
+            ranges[media_range] = q
+    return ranges
+
+
+def choose_format(accept: str):
+    """(media type, format, extension, options) the client accepts, or None for the original.
+
+    Only formats the client names explicitly count (image/* is also sent by
+    clients that can't decode AVIF); q=0 refuses one, and among the rest the
+    highest q wins, then the order of formats().
+    """
+    ranges = media_ranges(accept)
+    best, best_q = None, 0.0
+    for fmt in formats():
+        q = ranges.get(fmt[0], 0.0)
+        if q > best_q:
+            best, best_q = fmt, q
+    return best
+
+
+def source_hash(path: str, stat_result: os.stat_result) -> str:
+    key = (path, stat_result.st_mtime_ns, stat_result.st_size)
+    digest = _hashes.get(key)
+    if digest is None:
+        h = hashlib.sha256(f"v{PIPELINE_VERSION}:".encode())
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        digest = _hashes[key] = h.hexdigest()[:16]
+    return digest
+
+
+def _lock_for(target: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(target, threading.Lock())
+
+
+def variant(path: str, stat_result: os.stat_result, width: int, fmt) -> str:
+    """Path of the cached variant, generated if missing (blocking: call from a thread)"""
+    from PIL import Image
+
+    _, pil_format, extension, options = fmt
+    target = os.path.join(CACHE_DIR, f"{source_hash(path, stat_result)}-{width}w{extension}")
+    if target in _ready:
+        return target
+    # One worker encodes, concurrent requests for the same variant wait for it
+    with _lock_for(target):
+        if os.path.exists(target):
+            _ready.add(target)
+            return target
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with Image.open(path) as image:
+            # Convert first: palette images would otherwise be resized without filtering
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info or "A" in image.mode else "RGB")
+            if image.width > width:
+                image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+            tmp = f"{target}.{os.getpid()}.tmp"
+            image.save(tmp, pil_format, **options)
+        os.replace(tmp, target)  # Atomic: readers never see a partial file
+        _ready.add(target)
+    return target
+
+
+def pregenerate(directory: str) -> int:
+    """Every variant of every image in directory, returns the number of files written"""
+    written = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if os.path.splitext(name)[1].lower() not in SOURCE_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            stat_result = os.stat(path)
+            for fmt in formats():
+                for width in WIDTHS:
+                    target = os.path.join(CACHE_DIR, f"{source_hash(path, stat_result)}-{width}w{fmt[2]}")
+                    if not os.path.exists(target):
+                        written += 1
+                    variant(path, stat_result, width, fmt)
+    return written
+
+
+if __name__ == "__main__":
+    if not enabled():
+        print("Pillow with WebP/AVIF support is not installed; nothing to do.")
+        sys.exit(1)
+    images = sys.argv[1] if len(sys.argv) > 1 else os.path.join(BASE_DIR, "../public/images")
+    count = pregenerate(images)
+    print(f"Wrote {count} variants ({', '.join(f[1] for f in formats())}) to {CACHE_DIR}")
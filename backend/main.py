@@ -1,13 +1,76 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-import models, schemas, crud
-from database import SessionLocal, engine, get_db
+from starlette.concurrency import run_in_threadpool
+import schemas, crud_async
+from crud import InsufficientPointsError
+import database
+import db_pool
+import migrations
+import static_assets
+import image_variants
+import fast_json
+import metrics
+import cache_bus
+from database import get_db, DbSession
+from menu_cache import menu_cache
+from user_cache import user_cache
+from http_cache import make_etag, etag_matches, conditional_json
+
+def env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+def prepare_database(engine):
+    # Schema migrations (AUTO_MIGRATE=0 when they are run as a separate deploy step)
+    if env_flag("AUTO_MIGRATE", "1"):
+        migrations.upgrade(engine)
+    elif env_flag("SCHEMA_CHECK", "0"):
+        missing = migrations.pending(engine)
+        if missing:
+            raise RuntimeError(f"Database schema is missing migrations {missing}; run 'python migrations.py upgrade'")
+
+def prepare_static():
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    # gzip/brotli variants of the frontend build (no-op for files render_build.sh already did)
+    if os.path.exists(DIST_DIR):
+        static_assets.precompress(DIST_DIR)
+    else:
+        print(f"WARNING: '{DIST_DIR}' folder not found. Run 'npm run build' in frontend folder.")
+    dist_index.scan()
+    public_index.scan()
+    image_variants.enabled()  # Imports Pillow here rather than in the first image request
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Everything that touches the database or the disk happens here, not at
+    # import; the two don't depend on each other, so they overlap.
+    engine = database.engine
+    await asyncio.gather(run_in_threadpool(prepare_database, engine), run_in_threadpool(prepare_static))
+    # Evict menu/user cache entries when another worker changes them
+    listener = None
+    if cache_bus.supported(engine.dialect.name):
+        listener = cache_bus.Listener(engine.url, {"menu": invalidate_menu, "user": invalidate_users})
+        listener.start()
+    yield
+    if listener is not None:
+        await run_in_threadpool(listener.stop)
+    await database.dispose()
 
-app = FastAPI(title="Hoffee Shop API")
+def invalidate_menu(ids: Optional[list]):
+    menu_cache.invalidate()
+
+def invalidate_users(ids: Optional[list]):
+    if ids is None:
+        user_cache.clear()
+    else:
+        for user_id in ids:
+            user_cache.evict(user_id)
+
+app = FastAPI(title="Hoffee Shop API", lifespan=lifespan)
 
 # Allow CORS for development
 app.add_middleware(
@@ -18,245 +81,350 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency / SQL statement counts, scraped from /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
 @app.post("/api/auth", response_model=schemas.User)
-def auth_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, user_id=user.id)
+async def auth_user(user: schemas.UserCreate, db: DbSession = Depends(get_db)):
+    db_user = await crud_async.get_user(db, user_id=user.id)
     if db_user:
         # Update info if exists
-        updated_user = crud.update_user_profile(db, user.id, user.name, user.avatar_url)
+        updated_user = await crud_async.update_user_profile(db, user.id, user.name, user.avatar_url)
         return updated_user
     else:
-        return crud.create_user(db, user=user)
+        return await crud_async.create_user(db, user=user)
+
+def user_etag(db_user: schemas.User) -> str:
+    """ETag from the columns schemas.User is built from, so a 304 needs no serialization"""
+    fields = (
+        db_user.id, db_user.name, db_user.avatar_url, db_user.points,
+        db_user.lifetime_points, db_user.level_name, db_user.is_admin,
+    )
+    return make_etag(repr(fields).encode())
 
 @app.get("/api/users/{user_id}", response_model=schemas.User)
-def read_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, user_id=user_id)
+async def read_user(user_id: int, request: Request, db: DbSession = Depends(get_db)):
+    db_user = await crud_async.get_user_cached(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return db_user
+    if fast_json.ENABLED:
+        build_body = lambda: fast_json.dumps(fast_json.to_dict(db_user, schemas.User))
+    else:
+        build_body = lambda: schemas.User.model_validate(db_user).model_dump_json().encode()
+    return conditional_json(request, user_etag(db_user), build_body, cache_control="private, no-cache")
 
 class UpdatePointsRequest(schemas.BaseModel):
     points: int
     lifetime_points: int
 
 @app.post("/api/users/{user_id}/points", response_model=schemas.User)
-def update_points(user_id: int, data: UpdatePointsRequest, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, user_id=user_id)
+async def update_points(user_id: int, data: UpdatePointsRequest, db: DbSession = Depends(get_db)):
+    db_user = await crud_async.get_user_cached(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     
-    return crud.update_user_points(db, user_id, data.points, data.lifetime_points)
+    return await crud_async.update_user_points(db, user_id, data.points, data.lifetime_points)
 
 @app.post("/api/orders", response_model=schemas.Order)
-def create_order(order: schemas.OrderCreate, db: Session = Depends(get_db)):
-    db_order = crud.create_order(db, order)
+async def create_order(order: schemas.OrderCreate, db: DbSession = Depends(get_db)):
+    try:
+        db_order = await crud_async.create_order(db, order)
+    except InsufficientPointsError:
+        raise HTTPException(status_code=400, detail="Not enough points")
     if db_order is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_order
 
+@app.get("/api/users/{user_id}/orders", response_model=schemas.OrderHistoryPage)
+async def read_user_orders(
+    user_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: DbSession = Depends(get_db)
+):
+    """Order history, newest first; follow next_cursor for older orders"""
+    try:
+        return await crud_async.get_user_orders(db, user_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.post("/api/orders/batch", response_model=schemas.OrderBatchResponse)
+async def create_orders_batch(batch: schemas.OrderBatchCreate, db: DbSession = Depends(get_db)):
+    """Queued orders from kiosk/offline clients: one transaction, per-order results"""
+    results = await crud_async.create_orders_batch(db, batch.orders)
+    return {"results": results}
+
 # ============= PHASE 3: MENU API =============
 
 @app.get("/api/menu", response_model=schemas.MenuResponse)
-def get_menu(db: Session = Depends(get_db)):
+async def get_menu(request: Request, db: DbSession = Depends(get_db)):
     """Public endpoint: Get full menu with categories, products, and modifiers"""
-    categories = crud.get_categories(db)
-    return {"categories": categories}
+    snapshot = await menu_cache.load(db)
+    return conditional_json(request, snapshot.etag, lambda: snapshot.body)
 
 # --- Admin: Categories ---
-def check_admin(user_id: int, db: Session):
+async def check_admin(user_id: int, db: DbSession):
     """Helper to verify admin status"""
-    user = crud.get_user(db, user_id)
+    user = await crud_async.get_user_cached(db, user_id)
     if not user or not user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
     return user
 
 @app.post("/api/admin/categories", response_model=schemas.Category)
-def admin_create_category(
+async def admin_create_category(
     category: schemas.CategoryCreate,
     admin_id: int,
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
-    check_admin(admin_id, db)
-    existing = crud.get_category(db, category.id)
+    await check_admin(admin_id, db)
+    existing = await crud_async.get_category(db, category.id)
     if existing:
         raise HTTPException(status_code=400, detail="Category already exists")
-    return crud.create_category(db, category)
+    created = await crud_async.create_category(db, category)
+    menu_cache.invalidate()
+    return created
 
 @app.put("/api/admin/categories/{category_id}", response_model=schemas.Category)
-def admin_update_category(
+async def admin_update_category(
     category_id: str,
     category_update: schemas.CategoryUpdate,
     admin_id: int,
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
-    check_admin(admin_id, db)
-    updated = crud.update_category(db, category_id, category_update)
+    await check_admin(admin_id, db)
+    updated = await crud_async.update_category(db, category_id, category_update)
     if not updated:
         raise HTTPException(status_code=404, detail="Category not found")
+    menu_cache.invalidate()
     return updated
 
 @app.delete("/api/admin/categories/{category_id}")
-def admin_delete_category(
+async def admin_delete_category(
     category_id: str,
     admin_id: int,
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
-    check_admin(admin_id, db)
-    if not crud.delete_category(db, category_id):
+    await check_admin(admin_id, db)
+    if not await crud_async.delete_category(db, category_id):
         raise HTTPException(status_code=404, detail="Category not found")
+    menu_cache.invalidate()
     return {"ok": True}
 
 # --- Admin: Products ---
 @app.post("/api/admin/products", response_model=schemas.Product)
-def admin_create_product(
+async def admin_create_product(
     product: schemas.ProductCreate,
     admin_id: int,
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
-    check_admin(admin_id, db)
+    await check_admin(admin_id, db)
     # Check category exists
-    if not crud.get_category(db, product.category_id):
+    if not await crud_async.get_category(db, product.category_id):
         raise HTTPException(status_code=400, detail="Category not found")
-    return crud.create_product(db, product)
+    created = await crud_async.create_product(db, product)
+    menu_cache.invalidate()
+    return created
 
 @app.put("/api/admin/products/{product_id}", response_model=schemas.Product)
-def admin_update_product(
+async def admin_update_product(
     product_id: int,
     product_update: schemas.ProductUpdate,
     admin_id: int,
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
-    check_admin(admin_id, db)
-    updated = crud.update_product(db, product_id, product_update)
+    await check_admin(admin_id, db)
+    updated = await crud_async.update_product(db, product_id, product_update)
     if not updated:
         raise HTTPException(status_code=404, detail="Product not found")
+    menu_cache.invalidate()
     return updated
 
 @app.delete("/api/admin/products/{product_id}")
-def admin_delete_product(
+async def admin_delete_product(
     product_id: int,
     admin_id: int,
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
-    check_admin(admin_id, db)
-    if not crud.delete_product(db, product_id):
+    await check_admin(admin_id, db)
+    if not await crud_async.delete_product(db, product_id):
         raise HTTPException(status_code=404, detail="Product not found")
+    menu_cache.invalidate()
     return {"ok": True}
 
 # --- Admin: Modifiers ---
 @app.post("/api/admin/products/{product_id}/modifiers", response_model=schemas.Modifier)
-def admin_add_modifier(
+async def admin_add_modifier(
     product_id: int,
     modifier: schemas.ModifierCreate,
     admin_id: int,
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
-    check_admin(admin_id, db)
-    if not crud.get_product(db, product_id):
+    await check_admin(admin_id, db)
+    if not await crud_async.get_product(db, product_id):
         raise HTTPException(status_code=404, detail="Product not found")
-    return crud.add_modifier(db, product_id, modifier)
+    created = await crud_async.add_modifier(db, product_id, modifier)
+    menu_cache.invalidate()
+    return created
 
 @app.delete("/api/admin/modifiers/{modifier_id}")
-def admin_delete_modifier(
+async def admin_delete_modifier(
     modifier_id: int,
     admin_id: int,
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
-    check_admin(admin_id, db)
-    if not crud.delete_modifier(db, modifier_id):
+    await check_admin(admin_id, db)
+    if not await crud_async.delete_modifier(db, modifier_id):
         raise HTTPException(status_code=404, detail="Modifier not found")
+    menu_cache.invalidate()
     return {"ok": True}
 
+# --- Admin: Bulk menu ---
+@app.get("/api/admin/menu/export", response_model=schemas.MenuResponse)
+async def admin_export_menu(admin_id: int, db: DbSession = Depends(get_db)):
+    """Full menu tree with ids; can be edited and sent back to PUT /api/admin/menu"""
+    await check_admin(admin_id, db)
+    snapshot = await menu_cache.load(db)
+    return Response(content=snapshot.body, media_type="application/json")
+
+@app.put("/api/admin/menu", response_model=schemas.MenuSyncResult)
+async def admin_replace_menu(menu: schemas.MenuSync, admin_id: int, db: DbSession = Depends(get_db)):
+    """Replace the whole menu in one transaction (diffed against the current one)"""
+    await check_admin(admin_id, db)
+    category_ids = [c.id for c in menu.categories]
+    if len(set(category_ids)) != len(category_ids):
+        raise HTTPException(status_code=400, detail="Duplicate category id")
+    result = await crud_async.sync_menu(db, menu)
+    menu_cache.invalidate()
+    return result
+
+# --- Admin: Diagnostics ---
+@app.get("/api/admin/diagnostics/pool", response_model=schemas.PoolDiagnostics)
+async def admin_pool_diagnostics(admin_id: int, db: DbSession = Depends(get_db)):
+    """Connection pool usage of this worker"""
+    await check_admin(admin_id, db)
+    pools = {name: db_pool.pool_status(pool) for name, pool in engine_pools().items()}
+    return {"pid": os.getpid(), "pools": pools}
+
+def engine_pools() -> dict:
+    pools = {"sync": database.engine.pool}
+    if database.async_engine is not None:
+        pools["async"] = database.async_engine.pool
+    return pools
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Prometheus scrape endpoint (this worker only), behind METRICS_TOKEN"""
+    if not metrics.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not metrics.authorized(request.headers.get("authorization")):
+        raise HTTPException(status_code=401, detail="Invalid metrics token", headers={"WWW-Authenticate": "Bearer"})
+    return Response(metrics.render(engine_pools()), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # --- Favorites ---
 @app.get("/api/users/{user_id}/favorites", response_model=list[int])
-def get_user_favorites(user_id: int, db: Session = Depends(get_db)):
-    return crud.get_user_favorites(db, user_id)
+async def get_user_favorites(user_id: int, request: Request, db: DbSession = Depends(get_db)):
+    favorites = await crud_async.get_user_favorites(db, user_id)
+    # Hash of the ids (not the JSON), so a 304 skips serialization and the ETag
+    # doesn't depend on FAST_JSON. The query still runs: there is no version column.
+    etag = make_etag(",".join(map(str, favorites)).encode())
+
+    def build_body() -> bytes:
+        if fast_json.ENABLED:
+            return fast_json.dumps(favorites)
+        return json.dumps(favorites, separators=(",", ":")).encode()
+
+    return conditional_json(request, etag, build_body, cache_control="private, no-cache")
 
 @app.post("/api/users/{user_id}/favorites/{product_id}", response_model=schemas.Favorite)
-def add_favorite(user_id: int, product_id: int, db: Session = Depends(get_db)):
+async def add_favorite(user_id: int, product_id: int, db: DbSession = Depends(get_db)):
     # Verify user exists
-    if not crud.get_user(db, user_id):
+    if not await crud_async.get_user_cached(db, user_id):
          # Auto-create user if missing (for seamless UX)
          pass # Or raise error
     
     # Verify product exists
-    if not crud.get_product(db, product_id):
+    if not await crud_async.get_product(db, product_id):
         raise HTTPException(status_code=404, detail="Product not found")
 
-    return crud.add_favorite(db, user_id, product_id)
+    return await crud_async.add_favorite(db, user_id, product_id)
 
 @app.delete("/api/users/{user_id}/favorites/{product_id}")
-def remove_favorite(user_id: int, product_id: int, db: Session = Depends(get_db)):
-    if not crud.remove_favorite(db, user_id, product_id):
+async def remove_favorite(user_id: int, product_id: int, db: DbSession = Depends(get_db)):
+    if not await crud_async.remove_favorite(db, user_id, product_id):
          # It's okay if it didn't exist, but strict REST might 404. Let's return success.
          pass
     return {"ok": True}
 
 # Serve Static Files (CSS, JS, Images)
 
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
-import os
-import uvicorn
+from fastapi.responses import FileResponse
 
 # Robust path handling
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DIST_DIR = os.path.join(BASE_DIR, "../dist")
-STATIC_DIR = os.path.join(BASE_DIR, "static")
-
-# Create static directory if not exists
-if not os.path.exists(STATIC_DIR):
-    os.makedirs(STATIC_DIR)
-
-# Mount static files first
-# Check if dist exists (frontend build)
-if os.path.exists(DIST_DIR):
-    # Mount assets folder
-    assets_path = os.path.join(DIST_DIR, "assets")
-    if os.path.exists(assets_path):
-        app.mount("/assets", StaticFiles(directory=assets_path), name="assets")
-    
-    # Mount public folders for videos and images with caching
-    PUBLIC_DIR = os.path.join(BASE_DIR, "../public")
-    videos_path = os.path.join(PUBLIC_DIR, "videos")
-    images_path = os.path.join(PUBLIC_DIR, "images")
-    
-    # Custom video endpoint with strong cache headers for mobile
-    @app.get("/videos/{filename}")
-    async def serve_video(filename: str):
-        video_file = os.path.join(videos_path, filename)
-        if os.path.exists(video_file):
-            return FileResponse(
-                video_file,
-                media_type="video/mp4",
-                headers={
-                    "Cache-Control": "public, max-age=31536000, immutable",
-                    "Accept-Ranges": "bytes"
-                }
-            )
+STATIC_DIR = os.path.join(BASE_DIR, "static")  # Created at startup (see prepare_static)
+
+# Files are looked up in indexes built at startup (see lifespan), never on disk per request.
+# STATIC_RELOAD=1 rescans them when files change (dev, with `vite build --watch`).
+STATIC_RELOAD = env_flag("STATIC_RELOAD", "0")
+PUBLIC_DIR = os.path.join(BASE_DIR, "../public")
+dist_index = static_assets.StaticIndex(DIST_DIR, reload=STATIC_RELOAD)
+public_index = static_assets.StaticIndex(PUBLIC_DIR, reload=STATIC_RELOAD, keep_in_memory=())
+
+# Custom video endpoint with strong cache headers for mobile; byte ranges so players can seek
+@app.get("/videos/{filename}")
+@app.head("/videos/{filename}")
+async def serve_video(filename: str, request: Request):
+    entry = public_index.get(f"videos/{filename}")
+    if entry is None:
         raise HTTPException(status_code=404, detail="Video not found")
-    
-    if os.path.exists(images_path):
-        app.mount("/images", StaticFiles(directory=images_path), name="images")
-        print(f"Serving images from: {images_path}")
-    
-    # Serve index.html for root and any other path (SPA support)
-    @app.get("/{full_path:path}")
-    async def serve_spa(full_path: str):
-        # Allow API calls to pass through
-        if full_path.startswith("api"):
-            raise HTTPException(status_code=404, detail="Not found")
-        
-        # Determine if it's a file request or a route request
-        target_file = os.path.join(DIST_DIR, full_path)
-        if "." in full_path and os.path.exists(target_file):
-             return FileResponse(target_file)
-             
-        # Otherwise serve index.html
-        return FileResponse(os.path.join(DIST_DIR, "index.html"))
-else:
-    print(f"WARNING: '{DIST_DIR}' folder not found. Run 'npm run build' in frontend folder.")
+    return public_index.range_response(entry, request, static_assets.IMMUTABLE)
+
+@app.get("/images/{path:path}")
+async def serve_image(path: str, request: Request, w: Optional[int] = Query(None, ge=1, le=4096)):
+    entry = public_index.get(f"images/{path}")
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    fmt = None
+    if os.path.splitext(path)[1].lower() in image_variants.SOURCE_EXTENSIONS:
+        fmt = image_variants.choose_format(request.headers.get("accept", ""))
+    if fmt is None:
+        response = public_index.response(entry, request, static_assets.REVALIDATE)
+    else:
+        # Resized WebP/AVIF, encoded on first request and cached on disk under a content-hash name
+        width = image_variants.snap_width(w)
+        target = await run_in_threadpool(image_variants.variant, entry.path, entry.stat, width, fmt)
+        etag = f'"{os.path.basename(target)}"'
+        headers = {"ETag": etag, "Cache-Control": static_assets.REVALIDATE}
+        if etag_matches(request, etag):
+            response = Response(status_code=304, headers=headers)
+        else:
+            response = FileResponse(target, media_type=fmt[0], headers=headers)
+    response.headers["Vary"] = "Accept"
+    return response
+
+# Serve index.html for root and any other path (SPA support)
+@app.get("/{full_path:path}")
+async def serve_spa(full_path: str, request: Request):
+    # Allow API calls to pass through
+    if full_path.startswith("api"):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    entry = dist_index.get(full_path)
+    if entry is not None and full_path != "index.html":
+        # Vite content-hashes everything in assets/, so it can be cached forever
+        cache_control = static_assets.IMMUTABLE if full_path.startswith("assets/") else static_assets.REVALIDATE
+        return dist_index.response(entry, request, cache_control)
+    if full_path.startswith("assets/"):
+        raise HTTPException(status_code=404, detail="Not found")
+
+    # Otherwise serve index.html (always revalidated: it points at the current hashed assets)
+    index_html = dist_index.get("index.html")
+    if index_html is None:
+        raise HTTPException(status_code=404, detail="Frontend not built")
+    return dist_index.response(index_html, request, static_assets.REVALIDATE)
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("main:app", host="0.0.0.0", port=4000, reload=True)
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+import crud, crud_async, schemas
+import fast_json
+from http_cache import make_etag
+
+
+@dataclass(frozen=True)
+class MenuSnapshot:
+    version: int
+    body: bytes  # Serialized schemas.MenuResponse
+    etag: str
+
+
+class MenuCache:
+    """In-memory copy of the /api/menu payload.
+
+    The menu only changes through the admin endpoints, so the serialized JSON
+    is built once and reused until one of them calls invalidate().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()  # Only guards the version/snapshot swap, never held during I/O
+        self._async_lock: Optional[asyncio.Lock] = None
+        self._version = 0
+        self._snapshot: Optional[MenuSnapshot] = None
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def peek(self) -> Optional[MenuSnapshot]:
+        """Current snapshot without touching the database (None if stale)"""
+        return self._snapshot
+
+    def get(self, db: Session) -> MenuSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+
+        # Build without holding the lock: with DB_ASYNC=1 this runs on the event
+        # loop (run_sync), and a thread lock held across the query would block
+        # the loop for every other miss. The result is only stored if no
+        # invalidate() happened meanwhile, since it may predate that write.
+        version = self._version
+        categories = crud.get_menu(db)
+        if fast_json.ENABLED:
+            body = fast_json.dumps({"categories": fast_json.to_list(categories, schemas.Category)})
+        else:
+            body = schemas.MenuResponse(categories=categories).model_dump_json().encode()
+        snapshot = MenuSnapshot(version=version, body=body, etag=make_etag(body))
+        with self._lock:
+            if self._version == version:
+                self._snapshot = snapshot
+        return snapshot
+
+    async def load(self, db) -> MenuSnapshot:
+        """get() for async handlers; concurrent misses wait for one build instead of each querying"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()  # Created on the running loop (Python 3.9 binds it)
+        async with self._async_lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                snapshot = await crud_async.run(db, self.get)
+        return snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._snapshot = None
+
+
+menu_cache = MenuCache()
@@ -0,0 +1,249 @@
+"""
+Request and database instrumentation, exported in Prometheus text format.
+
+MetricsMiddleware times every HTTP request and labels it with the route
+template ("/api/users/{user_id}", not the raw path). SQLAlchemy cursor events,
+registered on the Engine class so they cover the sync and async engines,
+count the statements run and the time spent in the database; they are added
+to the current request's RequestStats through a contextvar (which follows
+the request into run_in_threadpool and the asyncpg greenlet).
+
+Requests slower than SLOW_REQUEST_MS (0 = off) are logged with the
+statements they ran.
+
+/metrics is off unless METRICS_TOKEN is set, and then needs
+"Authorization: Bearer <METRICS_TOKEN>" (Prometheus: `authorization:
+credentials: ...` in the scrape config). It shares the domain with the SPA,
+and the pool numbers are otherwise admin-only.
+"""
+import hmac
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+import db_pool
+
+logger = logging.getLogger(__name__)
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+SLOW_LOG_STATEMENTS = 50  # Per request, so one N+1 can't flood the log
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "statements")
+
+    def __init__(self, record_statements: bool):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = [] if record_statements else None
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}  # (method, route, status) -> Histogram
+        self.queries = {}  # (method, route) -> Histogram
+        self.db_seconds = {}  # (method, route) -> float
+        self.db_queries_total = 0
+        self.db_seconds_total = 0.0
+
+    def observe_request(self, method: str, route: str, status: int, elapsed: float, stats: RequestStats):
+        with self._lock:
+            key = (method, route, str(status))
+            if key not in self.latency:
+                self.latency[key] = Histogram(LATENCY_BUCKETS)
+            self.latency[key].observe(elapsed)
+            key = (method, route)
+            if key not in self.queries:
+                self.queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+            self.queries[key].observe(stats.queries)
+            self.db_seconds[key] = self.db_seconds.get(key, 0.0) + stats.db_time
+
+    def observe_query(self, elapsed: float):
+        with self._lock:
+            self.db_queries_total += 1
+            self.db_seconds_total += elapsed
+
+    def snapshot(self):
+        with self._lock:
+            return (
+                list(self.latency.items()), list(self.queries.items()), list(self.db_seconds.items()),
+                self.db_queries_total, self.db_seconds_total,
+            )
+
+
+registry = Registry()
+
+
+def authorized(authorization: Optional[str]) -> bool:
+    """Whether an Authorization header may read /metrics (never, without METRICS_TOKEN)"""
+    if not METRICS_TOKEN or not authorization:
+        return False
+    scheme, _, credentials = authorization.partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(credentials.strip().encode(), METRICS_TOKEN.encode())
+
+
+# --- SQLAlchemy hooks ---
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_started_at"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started_at", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    registry.observe_query(elapsed)
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+        if stats.statements is not None and len(stats.statements) < SLOW_LOG_STATEMENTS:
+            stats.statements.append((elapsed, statement))
+
+
+# --- ASGI middleware ---
+def _route_label(scope: Scope) -> str:
+    route = scope.get("route")
+    # Unmatched paths share one label so scanners can't blow up the label set
+    return route.path if route is not None else "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp, exclude: tuple = ("/metrics",)):
+        self.app = app
+        self.exclude = exclude
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(record_statements=SLOW_REQUEST_MS > 0)
+        token = _current.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _current.reset(token)
+            route = _route_label(scope)
+            registry.observe_request(scope["method"], route, status, elapsed, stats)
+            if SLOW_REQUEST_MS > 0 and elapsed * 1000 >= SLOW_REQUEST_MS:
+                _log_slow(scope, route, status, elapsed, stats)
+
+
+def _log_slow(scope: Scope, route: str, status: int, elapsed: float, stats: RequestStats):
+    lines = [
+        f"Slow request {scope['method']} {scope['path']} ({route}) -> {status}: "
+        f"{elapsed * 1000:.1f} ms, {stats.queries} queries, {stats.db_time * 1000:.1f} ms in DB"
+    ]
+    for query_time, statement in stats.statements:
+        lines.append(f"  {query_time * 1000:7.2f} ms  {' '.join(statement.split())[:300]}")
+    if stats.queries > len(stats.statements):
+        lines.append(f"  ... {stats.queries - len(stats.statements)} more")
+    logger.warning("\n".join(lines))
+
+
+# --- Prometheus text format ---
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, histogram: Histogram, **labels) -> list:
+    lines = []
+    cumulative = 0
+    for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram.total}")
+    lines.append(f"{name}_count{_labels(**labels)} {cumulative}")
+    return lines
+
+
+def render(pools: dict) -> str:
+    """Exposition text for all metrics, plus gauges for the given {name: pool}"""
+    latency, queries, db_seconds, db_queries_total, db_seconds_total = registry.snapshot()
+
+    lines = [
+        "# HELP http_request_duration_seconds Request latency by route template",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, route, status), histogram in latency:
+        lines += _histogram_lines("http_request_duration_seconds", histogram, method=method, route=route, status=status)
+    lines += [
+        "# HELP http_request_db_queries SQL statements per request",
+        "# TYPE http_request_db_queries histogram",
+    ]
+    for (method, route), histogram in queries:
+        lines += _histogram_lines("http_request_db_queries", histogram, method=method, route=route)
+    lines += [
+        "# HELP http_request_db_seconds_total Time spent in SQL statements, by route",
+        "# TYPE http_request_db_seconds_total counter",
+    ]
+    lines += [f"http_request_db_seconds_total{_labels(method=m, route=r)} {v}" for (m, r), v in db_seconds]
+    lines += [
+        "# HELP db_queries_total SQL statements executed, in and outside requests",
+        "# TYPE db_queries_total counter",
+        f"db_queries_total {db_queries_total}",
+        "# HELP db_query_seconds_total Time spent in SQL statements",
+        "# TYPE db_query_seconds_total counter",
+        f"db_query_seconds_total {db_seconds_total}",
+    ]
+
+    gauges = {
+        "db_pool_size": ("gauge", "size"),
+        "db_pool_checked_out": ("gauge", "checked_out"),
+        "db_pool_overflow": ("gauge", "overflow"),
+        "db_pool_checkouts_total": ("counter", "checkouts"),
+        "db_pool_waits_total": ("counter", "waits"),
+        "db_pool_wait_seconds_total": ("counter", "wait_time_total"),
+        "db_pool_timeouts_total": ("counter", "timeouts"),
+    }
+    statuses = {name: db_pool.pool_status(pool) for name, pool in pools.items()}
+    for metric, (kind, field) in gauges.items():
+        lines.append(f"# TYPE {metric} {kind}")
+        for name, status in statuses.items():
+            if field in status:
+                lines.append(f"{metric}{_labels(pool=name)} {status[field]}")
+    return "\n".join(lines) + "\n"
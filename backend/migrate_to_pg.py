@@ -1,11 +1,29 @@
+"""
+Streaming SQLite -> Postgres migration.
 
+Every table in models is copied in chunks (fetchmany + COPY FROM STDIN), so
+memory use does not depend on table size. Progress is checkpointed per table
+in the same transaction as each chunk: an interrupted run picks up where it
+stopped. At the end row counts and content checksums are compared.
+
+Usage:
+    python migrate_to_pg.py            # migrate (or resume), then verify
+    python migrate_to_pg.py --fresh    # truncate target tables and start over
+    python migrate_to_pg.py --verify   # only compare counts/checksums
+"""
+import argparse
+import datetime
+import hashlib
 import os
 import sqlite3
+
 import psycopg2
-from psycopg2.extras import execute_values
-from sqlalchemy import create_engine
+from sqlalchemy import Boolean, DateTime, Integer, create_engine
+
 from database import Base
-from models import User, Order, Category, Product, ProductModifier
+import migrations
+import models
+from pg_copy import copy_rows, reset_serial
 
 # Config
 SQLITE_DB = "backend/database.db" # Relative from project root if run from root, or just "database.db" if from backend
@@ -18,103 +36,203 @@ PG_PASSWORD = "history_password"
 PG_HOST = "localhost"
 PG_PORT = "5432"
 PG_DB = "history_app"
-PG_URL = f"postgresql://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB}"
+PG_URL = os.getenv("PG_URL", f"postgresql://{PG_USER}:{PG_PASSWORD}@{PG_HOST}:{PG_PORT}/{PG_DB}")
 
-# Tables to migrate in order
-TABLES = ["users", "categories", "products", "orders", "product_modifiers"]
+CHUNK_SIZE = int(os.getenv("MIGRATE_CHUNK_SIZE", "10000"))
+PROGRESS_TABLE = "_sqlite_migration_progress"
 
-def migrate():
-    print(f"Starting migration from {SQLITE_DB} to {PG_DB}...")
+# Tables in foreign key order (parents first). order_number_counter only
+# exists on SQLite; Postgres numbers orders from order_number_seq, which
+# reset_order_number_seq moves past the copied ids instead.
+TABLES = [t for t in Base.metadata.sorted_tables if t.name != models.OrderNumberCounter.__tablename__]
+ORDER_NUMBER_RE = r"^ORD-[0-9]{1,12}$"  # Sequence/counter ids; time-ordered ids are 13 base32 chars
 
-    # 1. Ensure Schema Exists & Clean State
-    print("Preparing schema in Postgres...")
-    try:
-        pg_engine = create_engine(PG_URL)
-        # We need to create tables if they don't exist
-        Base.metadata.create_all(bind=pg_engine)
-        
-        # Then truncate to ensure we don't have duplicates if we re-run
-        pg_conn = psycopg2.connect(PG_URL)
-        cur = pg_conn.cursor()
-        for table in TABLES:
-             # Check if table has data
-             cur.execute(f"TRUNCATE TABLE {table} CASCADE;")
+
+def sqlite_columns(sl_conn, table) -> list:
+    """Model columns that also exist in the SQLite table (older files lack newer columns)"""
+    existing = {row[1] for row in sl_conn.execute(f"PRAGMA table_info({table.name})")}
+    return [c for c in table.columns if c.name in existing]
+
+
+def _normalize(value, column):
+    """Same Python value whichever database it came from"""
+    if value is None:
+        return None
+    if isinstance(column.type, Boolean):
+        return bool(value)
+    if isinstance(column.type, DateTime):
+        if isinstance(value, str):
+            value = datetime.datetime.fromisoformat(value)
+        return value.isoformat()
+    if isinstance(column.type, Integer):
+        return int(value)
+    return value
+
+
+def _checksum(rows, columns) -> int:
+    """Order-independent checksum (sum of per-row hashes): the two databases sort text differently"""
+    total = 0
+    for row in rows:
+        normalized = repr(tuple(_normalize(v, c) for v, c in zip(row, columns)))
+        total += int.from_bytes(hashlib.blake2b(normalized.encode(), digest_size=8).digest(), "big")
+    return total % (1 << 64)
+
+
+def _chunks(cursor):
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            return
+        yield rows
+
+
+def prepare(pg_conn, fresh: bool):
+    # Bring the target schema up to date (tables, sequences, indexes)
+    migrations.upgrade(create_engine(PG_URL))
+    with pg_conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {PROGRESS_TABLE} (
+                table_name TEXT PRIMARY KEY,
+                last_rowid BIGINT NOT NULL DEFAULT 0,
+                rows_copied BIGINT NOT NULL DEFAULT 0,
+                done BOOLEAN NOT NULL DEFAULT FALSE
+            )
+        """)
+        if fresh:
+            cur.execute(f"TRUNCATE TABLE {', '.join(t.name for t in TABLES)} CASCADE")
+            cur.execute(f"DELETE FROM {PROGRESS_TABLE}")
+    pg_conn.commit()
+
+
+def reset_order_number_seq(sl_conn, cur):
+    """Move order_number_seq past the ORD-<n> ids copied into orders and the SQLite counter"""
+    cur.execute(
+        "SELECT MAX(CAST(SUBSTRING(id FROM 5) AS BIGINT)) FROM orders WHERE id ~ %s",
+        (ORDER_NUMBER_RE,),
+    )
+    candidates = [cur.fetchone()[0]]
+    has_counter = sl_conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'order_number_counter'"
+    ).fetchone()
+    if has_counter:
+        candidates.append(sl_conn.execute("SELECT MAX(last_value) FROM order_number_counter").fetchone()[0])
+    last = max((c for c in candidates if c is not None), default=None)
+    if last is not None:
+        cur.execute(f"SELECT setval('{models.order_number_seq.name}', %s)", (last,))
+
+
+def migrate_table(sl_conn, pg_conn, table):
+    with pg_conn.cursor() as cur:
+        cur.execute(
+            f"SELECT last_rowid, rows_copied, done FROM {PROGRESS_TABLE} WHERE table_name = %s",
+            (table.name,),
+        )
+        last_rowid, copied, done = cur.fetchone() or (0, 0, False)
+        if done:
+            print(f"  ✓ '{table.name}' already migrated ({copied} rows).")
+            return
+
+        columns = sqlite_columns(sl_conn, table)
+        if not columns:
+            print(f"  Table '{table.name}' not found in SQLite. Skipping.")
+        else:
+            names = [c.name for c in columns]
+            booleans = [isinstance(c.type, Boolean) for c in columns]
+            sl_cursor = sl_conn.execute(
+                f"SELECT rowid, {', '.join(names)} FROM {table.name} WHERE rowid > ? ORDER BY rowid",
+                (last_rowid,),
+            )
+            for rows in _chunks(sl_cursor):
+                # SQLite stores booleans as 0/1
+                values = (
+                    [bool(v) if is_bool and v is not None else v for v, is_bool in zip(row[1:], booleans)]
+                    for row in rows
+                )
+                copied += copy_rows(cur, table.name, names, values)
+                last_rowid = rows[-1][0]
+                # Checkpoint commits together with the chunk it describes
+                cur.execute(f"""
+                    INSERT INTO {PROGRESS_TABLE} (table_name, last_rowid, rows_copied)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (table_name) DO UPDATE
+                    SET last_rowid = EXCLUDED.last_rowid, rows_copied = EXCLUDED.rows_copied
+                """, (table.name, last_rowid, copied))
+                pg_conn.commit()
+                print(f"  ... {table.name}: {copied} rows")
+
+        # Serial ids were copied explicitly; move their sequences past them
+        for column in table.primary_key.columns:
+            if column.autoincrement is True:
+                reset_serial(cur, table.name, column.name)
+        if table.name == models.Order.__tablename__:
+            reset_order_number_seq(sl_conn, cur)
+        cur.execute(f"""
+            INSERT INTO {PROGRESS_TABLE} (table_name, done) VALUES (%s, TRUE)
+            ON CONFLICT (table_name) DO UPDATE SET done = TRUE
+        """, (table.name,))
+    pg_conn.commit()
+    print(f"  ✓ Migrated '{table.name}' ({copied} rows).")
+
+
+def verify(sl_conn, pg_conn) -> bool:
+    ok = True
+    for table in TABLES:
+        columns = sqlite_columns(sl_conn, table)
+        if not columns:
+            continue
+        names = ", ".join(c.name for c in columns)
+
+        sl_cursor = sl_conn.execute(f"SELECT {names} FROM {table.name}")
+        sl_count, sl_sum = 0, 0
+        for rows in _chunks(sl_cursor):
+            sl_count += len(rows)
+            sl_sum = (sl_sum + _checksum(rows, columns)) % (1 << 64)
+
+        # Named cursor = server-side, streams instead of loading the table
+        with pg_conn.cursor(name=f"verify_{table.name}") as pg_cursor:
+            pg_cursor.itersize = CHUNK_SIZE
+            pg_cursor.execute(f"SELECT {names} FROM {table.name}")
+            pg_count, pg_sum = 0, 0
+            for rows in _chunks(pg_cursor):
+                pg_count += len(rows)
+                pg_sum = (pg_sum + _checksum(rows, columns)) % (1 << 64)
         pg_conn.commit()
-        pg_conn.close()
-        print("Schema ensured and tables truncated.")
-    except Exception as e:
-        print(f"Error preparing schema: {e}")
-        # Continue anyway, maybe tables exist
 
+        if (sl_count, sl_sum) == (pg_count, pg_sum):
+            print(f"  ✓ {table.name}: {pg_count} rows, checksum {pg_sum:016x}")
+        else:
+            ok = False
+            print(f"  ✗ {table.name}: SQLite {sl_count} rows/{sl_sum:016x}, Postgres {pg_count} rows/{pg_sum:016x}")
+    return ok
 
-    # 2. Connect to SQLite
-    try:
-        sl_conn = sqlite3.connect(SQLITE_DB)
-        sl_cursor = sl_conn.cursor()
-    except Exception as e:
-        print(f"Error connecting to SQLite {SQLITE_DB}: {e}")
-        return
-
-    # 3. Migrate Data
-    pg_conn = None
+
+def migrate(fresh: bool = False, verify_only: bool = False):
+    print(f"Starting migration from {SQLITE_DB} to {PG_DB}...")
+
+    sl_conn = sqlite3.connect(SQLITE_DB)
+    pg_conn = psycopg2.connect(PG_URL)
     try:
-        pg_conn = psycopg2.connect(PG_URL)
-        pg_cursor = pg_conn.cursor()
-
-        for table in TABLES:
-            print(f"Migrating table '{table}'...")
-            
-            # Check if table exists in SQLite
-            try:
-                sl_cursor.execute(f"SELECT * FROM {table}")
-                rows = sl_cursor.fetchall()
-                
-                # Manual fix for Booleans in 'users' table (is_admin)
-                if table == "users":
-                    # Assuming is_admin is the last column or we find it by name.
-                    # Let's inspect columns to find index of is_admin
-                    cols = [d[0] for d in sl_cursor.description]
-                    try:
-                        idx = cols.index("is_admin")
-                        # Convert 1 -> True, 0 -> False
-                        new_rows = []
-                        for r in rows:
-                            r_list = list(r)
-                            r_list[idx] = bool(r_list[idx])
-                            new_rows.append(tuple(r_list))
-                        rows = new_rows
-                    except ValueError:
-                        pass # is_admin not found
-            except sqlite3.OperationalError:
-                print(f"  Table '{table}' not found in SQLite. Skipping.")
-                continue
-
-            if not rows:
-                print(f"  No data in '{table}'.")
-                continue
-
-            # Get columns
-            columns = [description[0] for description in sl_cursor.description]
-            cols_str = ", ".join(columns)
-            # Bulk Insert
-            # execute_values expects a query with "VALUES %s"
-            insert_query = f"INSERT INTO {table} ({cols_str}) VALUES %s"
-            
-            try:
-                execute_values(pg_cursor, insert_query, rows)
-                pg_conn.commit()
-                print(f"  ✓ Migrated {len(rows)} rows.")
-            except Exception as e:
-                pg_conn.rollback()
-                print(f"  ✗ Error migrating '{table}': {e}")
+        if not verify_only:
+            prepare(pg_conn, fresh)
+            for table in TABLES:
+                print(f"Migrating table '{table.name}'...")
+                migrate_table(sl_conn, pg_conn, table)
 
-    except Exception as e:
-        print(f"Migration error: {e}")
+        print("Verifying...")
+        if verify(sl_conn, pg_conn):
+            print("✅ Migration verified.")
+        else:
+            print("❌ Verification failed.")
+            raise SystemExit(1)
     finally:
-        if sl_conn: sl_conn.close()
-        if pg_conn: 
-            pg_conn.close()
-            print("Postgres connection closed.")
+        sl_conn.close()
+        pg_conn.close()
+        print("Postgres connection closed.")
+
 
 if __name__ == "__main__":
-    migrate()
+    parser = argparse.ArgumentParser(description="Copy the SQLite database into Postgres")
+    parser.add_argument("--fresh", action="store_true", help="truncate target tables and restart from scratch")
+    parser.add_argument("--verify", action="store_true", help="only compare row counts and checksums")
+    args = parser.parse_args()
+    migrate(fresh=args.fresh, verify_only=args.verify)
@@ -0,0 +1,316 @@
+"""
+Versioned schema migrations.
+
+Applied versions are recorded in the schema_migrations table; upgrade() runs
+the missing ones in order. It runs on app startup (see main.py) unless
+AUTO_MIGRATE=0, in which case SCHEMA_CHECK=1 makes startup fail while
+migrations are pending. It can be run by hand before deploying:
+
+    python migrations.py upgrade   # apply pending migrations
+    python migrations.py status    # list applied/pending versions
+    python migrations.py check     # EXPLAIN the crud hot-path queries (Postgres),
+                                   # exit 1 if one of them can't use an index
+
+On Postgres indexes are built with CREATE INDEX CONCURRENTLY, so adding them
+to a live database does not block writes to the table.
+"""
+import datetime
+import sys
+import os
+import time
+
+from sqlalchemy import (
+    BigInteger, Boolean, Column, DateTime, ForeignKey, Index, Integer, MetaData, Sequence, String, Table,
+    event, inspect, select, text,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import models
+
+# Arbitrary key for the advisory lock: one worker migrates, the others wait
+MIGRATION_LOCK_ID = 482_913_001
+MIGRATION_LOCK_POLL = 0.5  # Seconds between pg_try_advisory_lock attempts
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def _create_index(conn, name: str, table: str, columns: str):
+    if conn.dialect.name != "postgresql":
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+        return
+    # An interrupted CONCURRENTLY build leaves an invalid index behind; rebuild it
+    invalid = conn.execute(text(
+        "SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {"name": name}).first()
+    if invalid:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})"))
+
+
+# --- Migrations (never edit an applied one, add a new version instead) ---
+# A migration must not build its DDL from models: models describe the latest
+# schema, so a fresh database would get later columns from an early migration
+# and the later migration that adds them would then fail.
+
+# The schema as models described it when migrations were introduced (what
+# create_all used to do at import). Frozen: don't change it with models.
+_v1 = MetaData()
+Sequence("order_number_seq", start=10000000, metadata=_v1)
+Table(
+    "users", _v1,
+    Column("id", BigInteger, primary_key=True, index=True),
+    Column("name", String, index=True),
+    Column("avatar_url", String, nullable=True),
+    Column("points", Integer),
+    Column("lifetime_points", Integer),
+    Column("level_name", String),
+    Column("is_admin", Boolean),
+)
+Table(
+    "orders", _v1,
+    Column("id", String, primary_key=True),
+    Column("user_id", BigInteger, ForeignKey("users.id")),
+    Column("total_price", Integer),
+    Column("points_used", Integer),
+    Column("points_earned", Integer),
+    Column("items_summary", String),
+    Column("created_at", DateTime),
+    Column("comment", String, nullable=True),
+    Column("pickup_time", String, nullable=True),
+    Index("ix_orders_user_id_created_at_id", "user_id", "created_at", "id"),
+)
+Table(
+    "categories", _v1,
+    Column("id", String, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("sort_order", Integer),
+)
+Table(
+    "products", _v1,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("name", String, nullable=False),
+    Column("description", String, nullable=True),
+    Column("price", Integer, nullable=False),
+    Column("category_id", String, ForeignKey("categories.id")),
+    Column("image_url", String, nullable=True),
+    Column("video_url", String, nullable=True),
+    Column("sort_order", Integer),
+    Index("ix_products_category_id_sort_order", "category_id", "sort_order"),
+)
+Table(
+    "product_modifiers", _v1,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("product_id", Integer, ForeignKey("products.id"), index=True),
+    Column("modifier_type", String, nullable=False),
+    Column("name", String, nullable=False),
+    Column("price", Integer),
+)
+Table(
+    "favorites", _v1,
+    Column("user_id", BigInteger, ForeignKey("users.id"), primary_key=True),
+    Column("product_id", Integer, ForeignKey("products.id"), primary_key=True),
+    Column("created_at", DateTime),
+    Index("ix_favorites_product_id", "product_id"),
+)
+
+
+def _0001_base_schema(conn):
+    """Tables that don't exist yet (databases from before migrations have some or all of them)"""
+    _v1.create_all(bind=conn)
+
+
+def _0002_hot_path_indexes(conn):
+    # favorites.user_id is already the leading column of the favorites primary key
+    _create_index(conn, "ix_products_category_id_sort_order", "products", "category_id, sort_order")
+    _create_index(conn, "ix_product_modifiers_product_id", "product_modifiers", "product_id")
+    _create_index(conn, "ix_orders_user_id_created_at_id", "orders", "user_id, created_at, id")
+    _create_index(conn, "ix_favorites_product_id", "favorites", "product_id")
+
+
+def _0003_order_number_counter(conn):
+    # Postgres uses order_number_seq instead
+    if conn.dialect.name == "postgresql":
+        return
+    table = Table(
+        "order_number_counter", MetaData(),
+        Column("id", Integer, primary_key=True),
+        Column("last_value", BigInteger, nullable=False),
+    )
+    table.create(bind=conn, checkfirst=True)
+    if conn.execute(select(table.c.id)).first() is None:
+        conn.execute(table.insert().values(id=1, last_value=10000000 - 1))  # order_number_seq starts at 10000000
+
+
+MIGRATIONS = [
+    (1, "Base schema", _0001_base_schema),
+    (2, "Hot-path indexes", _0002_hot_path_indexes),
+    (3, "Order number counter (no sequences)", _0003_order_number_counter),
+]
+
+
+def applied_versions(conn) -> set:
+    schema_migrations.create(bind=conn, checkfirst=True)
+    return set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending(engine: Engine) -> list:
+    """Versions not applied yet (read-only, unlike applied_versions)"""
+    with engine.connect() as conn:
+        done = set()
+        if inspect(conn).has_table(schema_migrations.name):
+            done = set(conn.execute(select(schema_migrations.c.version)).scalars())
+    return [version for version, _, _ in MIGRATIONS if version not in done]
+
+
+def _wait_for_lock(conn):
+    """Take the migration lock, polling instead of blocking in pg_advisory_lock.
+
+    A backend waiting in pg_advisory_lock is running a statement and holds a
+    snapshot; CREATE/DROP INDEX CONCURRENTLY in the migrating worker waits for
+    every older snapshot, so the two would deadlock. Between polls this
+    (autocommit) connection is idle and holds none.
+    """
+    waiting = False
+    while not conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID}).scalar():
+        if not waiting:
+            print("Waiting for another process to finish migrating...")
+            waiting = True
+        time.sleep(MIGRATION_LOCK_POLL)
+
+
+def upgrade(engine: Engine) -> list:
+    """Apply pending migrations, returns the versions applied"""
+    # Usual case on worker start: nothing to do, and no lock to queue for
+    if not pending(engine):
+        return []
+    applied_now = []
+    # Autocommit: CREATE INDEX CONCURRENTLY can't run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        is_postgres = conn.dialect.name == "postgresql"
+        if is_postgres:
+            _wait_for_lock(conn)
+        try:
+            done = applied_versions(conn)
+            for version, description, migrate in MIGRATIONS:
+                if version in done:
+                    continue
+                print(f"Applying migration {version}: {description}")
+                migrate(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=version, description=description, applied_at=datetime.datetime.utcnow()
+                ))
+                applied_now.append(version)
+        finally:
+            if is_postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+    return applied_now
+
+
+# --- Index usage check ---
+def hot_path_queries(conn) -> dict:
+    """The filtered statements crud runs on every request: name -> [(sql, params)].
+
+    Captured from crud's own functions, so the check follows crud when its
+    queries change. A sample category and product are inserted so get_menu
+    loads products and modifiers too; run inside a transaction that the
+    caller rolls back.
+    """
+    import crud
+
+    db = Session(bind=conn, autoflush=False)
+    category = models.Category(id="__index_check__", name="Index check", sort_order=0)
+    product = models.Product(name="Index check", price=0, category=category, sort_order=0)
+    db.add_all([category, product])
+    db.flush()
+
+    cursor = crud.encode_order_cursor(datetime.datetime(2030, 1, 1), "ORD-0")
+    calls = {
+        "get_user": lambda: crud.get_user(db, 1),
+        "get_menu": lambda: crud.get_menu(db),
+        "get_products": lambda: crud.get_products(db, category.id),
+        "get_user_favorites": lambda: crud.get_user_favorites(db, 1),
+        "get_user_orders": lambda: crud.get_user_orders(db, 1, cursor=cursor),
+        "sync_menu (delete_products)": lambda: crud.delete_products(db, [product.id]),
+    }
+    queries = {}
+    for name, call in calls.items():
+        statements = []
+        listener = lambda conn, cursor, statement, parameters, *args: statements.append((statement, parameters))
+        event.listen(conn, "before_cursor_execute", listener)
+        try:
+            call()
+        finally:
+            event.remove(conn, "before_cursor_execute", listener)
+        # Only filtered statements; get_menu's categories query reads the whole table
+        queries[name] = [(sql, params) for sql, params in statements if "WHERE" in sql.split()]
+    db.close()
+    return queries
+
+
+INDEX_SCANS = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+
+def _full_scans(node: dict) -> list:
+    """Scan nodes in an EXPLAIN (FORMAT JSON) plan that read a whole table or index"""
+    found = []
+    if node["Node Type"] == "Seq Scan" or (node["Node Type"] in INDEX_SCANS and "Index Cond" not in node):
+        found.append(f"{node['Node Type']} on {node.get('Relation Name') or node.get('Index Name')}")
+    for child in node.get("Plans", []):
+        found.extend(_full_scans(child))
+    return found
+
+
+def check(engine: Engine) -> bool:
+    if engine.dialect.name != "postgresql":
+        print("Index check needs Postgres; skipping.")
+        return True
+    ok = True
+    with engine.connect() as conn:
+        # Tiny tables make the planner prefer sequential scans anyway; we only
+        # want to know whether an index *can* serve each query.
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+        for name, statements in hot_path_queries(conn).items():
+            full_scans = []
+            for sql, params in statements:
+                plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}", params).scalar()
+                full_scans.extend(_full_scans(plan[0]["Plan"]))
+            uses_index = bool(statements) and not full_scans
+            ok = ok and uses_index
+            print(f"  {'✓' if uses_index else '✗'} {name}")
+            if not statements:
+                print("    no filtered statement captured")
+            for scan in full_scans:
+                print(f"    {scan}")
+        conn.rollback()
+    return ok
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    if command == "upgrade":
+        applied = upgrade(engine)
+        print(f"Applied {applied}" if applied else "Schema is up to date.")
+    elif command == "status":
+        with engine.connect() as conn:
+            done = applied_versions(conn)
+            conn.commit()
+        for version, description, _ in MIGRATIONS:
+            print(f"  [{'x' if version in done else ' '}] {version}: {description}")
+    elif command == "check":
+        if not check(engine):
+            sys.exit(1)
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, BigInteger, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, BigInteger, ForeignKey, DateTime, Sequence, Index
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -24,10 +24,22 @@ class User(Base):
         from utils import get_next_level_points
         return get_next_level_points(self.lifetime_points)
 
+# Order numbers for ORD-<n> ids (see order_ids.py). Starts above the legacy
+# random ORD-1000..9999 range and stays 8 digits wide for ~90M orders, so ids
+# sort by creation time.
+order_number_seq = Sequence("order_number_seq", start=10000000, metadata=Base.metadata)
+
+class OrderNumberCounter(Base):
+    """order_number_seq for databases without sequences (SQLite): one row, bumped with UPDATE ... RETURNING"""
+    __tablename__ = "order_number_counter"
+
+    id = Column(Integer, primary_key=True)
+    last_value = Column(BigInteger, nullable=False)
+
 class Order(Base):
     __tablename__ = "orders"
 
-    id = Column(String, primary_key=True) # e.g. ORD-1234
+    id = Column(String, primary_key=True) # e.g. ORD-10000042
     user_id = Column(BigInteger, ForeignKey("users.id"))
     total_price = Column(Integer)
     points_used = Column(Integer)
@@ -39,6 +51,11 @@ class Order(Base):
 
     user = relationship("User", back_populates="orders")
 
+    __table_args__ = (
+        # Order history: WHERE user_id = ? ORDER BY created_at DESC, id DESC (keyset pages)
+        Index("ix_orders_user_id_created_at_id", "user_id", "created_at", "id"),
+    )
+
 # Phase 3: Menu Models
 class Category(Base):
     __tablename__ = "categories"
@@ -47,7 +64,8 @@ class Category(Base):
     name = Column(String, nullable=False)
     sort_order = Column(Integer, default=0)
     
-    products = relationship("Product", back_populates="category", cascade="all, delete-orphan")
+    products = relationship("Product", back_populates="category", cascade="all, delete-orphan",
+                            order_by="(Product.sort_order, Product.id)")
 
 class Product(Base):
     __tablename__ = "products"
@@ -62,13 +80,19 @@ class Product(Base):
     sort_order = Column(Integer, default=0)
     
     category = relationship("Category", back_populates="products")
-    modifiers = relationship("ProductModifier", back_populates="product", cascade="all, delete-orphan")
+    modifiers = relationship("ProductModifier", back_populates="product", cascade="all, delete-orphan",
+                             order_by="ProductModifier.id")
+
+    __table_args__ = (
+        # Menu loading / category listing: WHERE category_id = ? ORDER BY sort_order
+        Index("ix_products_category_id_sort_order", "category_id", "sort_order"),
+    )
 
 class ProductModifier(Base):
     __tablename__ = "product_modifiers"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
+    product_id = Column(Integer, ForeignKey("products.id"), index=True)
     modifier_type = Column(String, nullable=False)  # "size", "milk", "syrup"
     name = Column(String, nullable=False)
     price = Column(Integer, default=0)
@@ -81,3 +105,9 @@ class Favorite(Base):
     user_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
     product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    # Lookups by user_id use the primary key (user_id, product_id);
+    # this one serves deleting a product's favorites
+    __table_args__ = (
+        Index("ix_favorites_product_id", "product_id"),
+    )
@@ -0,0 +1,132 @@
+"""Order ID generation.
+
+ORDER_ID_STRATEGY picks the generator:
+
+    sequence  ORD-10000042 from the order_number_seq Postgres sequence.
+              Unique across any number of workers, no retries needed.
+    counter   The same ORD-<n> numbers from the one-row order_number_counter
+              table, for databases without sequences (SQLite). The UPDATE
+              locks the row until commit, so orders are numbered one at a time.
+    time      ORD-<13 chars>, a time-ordered 63-bit id (ms timestamp, node,
+              counter) in Crockford base32. Needs no database round trip, but
+              every worker on every host needs its own ORDER_ID_NODE (0-1023);
+              it isn't derived from the pid, which can repeat across
+              containers and collides modulo 1024.
+
+The default is "sequence" on Postgres and "counter" elsewhere. All of them
+keep ids increasing over time, so inserts append to the orders primary key
+index.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+import models
+
+PREFIX = "ORD-"
+
+
+class SequenceOrderIds:
+    def next_ids(self, db: Session, count: int = 1) -> list[str]:
+        next_value = models.order_number_seq.next_value()
+        if count == 1:
+            numbers = [db.scalar(select(next_value))]
+        else:
+            numbers = db.scalars(
+                select(next_value).select_from(func.generate_series(1, count))
+            ).all()
+        return [f"{PREFIX}{n}" for n in numbers]
+
+
+class CounterOrderIds:
+    def next_ids(self, db: Session, count: int = 1) -> list[str]:
+        counter = models.OrderNumberCounter.__table__
+        last = db.execute(
+            update(counter)
+            .where(counter.c.id == 1)
+            .values(last_value=counter.c.last_value + count)
+            .returning(counter.c.last_value)
+        ).scalar_one()
+        return [f"{PREFIX}{n}" for n in range(last - count + 1, last + 1)]
+
+
+class TimeOrderedIds:
+    EPOCH_MS = 1735689600000  # 2025-01-01 UTC
+    NODE_BITS = 10
+    COUNTER_BITS = 12
+    ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"  # Crockford base32
+
+    def __init__(self, node: int):
+        if not 0 <= node < (1 << self.NODE_BITS):
+            raise ValueError(f"ORDER_ID_NODE must be between 0 and {(1 << self.NODE_BITS) - 1}, got {node}")
+        self.node = node
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._counter = 0
+
+    def _next_int(self) -> int:
+        with self._lock:
+            now = max(int(time.time() * 1000), self._last_ms)  # Never go back in time
+            if now == self._last_ms:
+                self._counter = (self._counter + 1) & ((1 << self.COUNTER_BITS) - 1)
+                if self._counter == 0:
+                    # 4096 ids in this millisecond already; borrow the next one
+                    now += 1
+            else:
+                self._counter = 0
+            self._last_ms = now
+            return (
+                ((now - self.EPOCH_MS) << (self.NODE_BITS + self.COUNTER_BITS))
+                | (self.node << self.COUNTER_BITS)
+                | self._counter
+            )
+
+    def _encode(self, value: int) -> str:
+        chars = []
+        for _ in range(13):  # 65 bits, fixed width so ids sort lexicographically
+            chars.append(self.ALPHABET[value & 31])
+            value >>= 5
+        return "".join(reversed(chars))
+
+    def next_ids(self, db: Session, count: int = 1) -> list[str]:
+        return [f"{PREFIX}{self._encode(self._next_int())}" for _ in range(count)]
+
+
+def _time_ordered_ids() -> TimeOrderedIds:
+    node = os.getenv("ORDER_ID_NODE")
+    if node is None:
+        raise RuntimeError("ORDER_ID_STRATEGY=time needs a unique ORDER_ID_NODE (0-1023) for every worker")
+    return TimeOrderedIds(int(node))
+
+
+STRATEGIES = {
+    "sequence": SequenceOrderIds,
+    "counter": CounterOrderIds,
+    "time": _time_ordered_ids,
+}
+_generators = {}
+_generators_lock = threading.Lock()
+
+
+def get_generator(db: Session):
+    strategy = os.getenv("ORDER_ID_STRATEGY")
+    if strategy is None:
+        strategy = "sequence" if db.get_bind().dialect.name == "postgresql" else "counter"
+    generator = _generators.get(strategy)
+    if generator is None:
+        with _generators_lock:
+            if strategy not in _generators:
+                _generators[strategy] = STRATEGIES[strategy]()
+            generator = _generators[strategy]
+    return generator
+
+
+def next_order_ids(db: Session, count: int) -> list[str]:
+    return get_generator(db).next_ids(db, count)
+
+
+def next_order_id(db: Session) -> str:
+    return next_order_ids(db, 1)[0]
@@ -0,0 +1,40 @@
+"""Streaming rows into Postgres with COPY FROM STDIN (psycopg2 cursors)"""
+import io
+from typing import Iterable, Sequence
+
+
+def _csv_field(value) -> str:
+    # Unquoted empty is NULL in CSV COPY; strings are always quoted so '' stays ''
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def copy_rows(cursor, table: str, columns: Sequence[str], rows: Iterable[Sequence]) -> int:
+    """COPY rows into table in one round trip, returns the number of rows"""
+    buf = io.StringIO()
+    count = 0
+    for row in rows:
+        buf.write(",".join(_csv_field(v) for v in row))
+        buf.write("\n")
+        count += 1
+    if count:
+        buf.seek(0)
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf
+        )
+    return count
+
+
+def reset_serial(cursor, table: str, column: str = "id"):
+    """Move a serial column's sequence past the ids loaded with COPY"""
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({column}), 1), MAX({column}) IS NOT NULL) FROM {table}",
+        (table, column),
+    )
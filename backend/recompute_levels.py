@@ -0,0 +1,104 @@
+"""
+Recompute users.level_name from lifetime_points for every user.
+
+Run after changing COFFEE_LEVELS in utils.py; otherwise users keep their old
+level until their next profile update. Users are streamed in keyset-ordered
+chunks, levels are looked up with a vectorized searchsorted over the
+thresholds (numpy when installed, bisect otherwise), and only changed rows are
+written back with one UPDATE ... FROM (VALUES ...) per chunk. The UPDATE only
+applies where lifetime_points is still the value the level was computed from:
+an order committed in between has already set the right level itself.
+
+Usage:
+    python recompute_levels.py [--chunk-size 50000] [--dry-run]
+"""
+import argparse
+import sys
+import os
+import time
+from bisect import bisect_right
+
+from psycopg2.extras import execute_values
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import engine
+import utils
+
+try:
+    import numpy as np
+except ImportError:  # Optional: bisect is fast enough, numpy is faster
+    np = None
+
+LEVEL_NAMES = [level['name'] for level in utils.COFFEE_LEVELS]
+
+
+def level_names_for(lifetime_points: list) -> list:
+    """Level name for each lifetime_points value (None counts as 0)"""
+    points = [p or 0 for p in lifetime_points]
+    if np is not None:
+        indexes = np.searchsorted(utils.LEVEL_THRESHOLDS, points, side='right') - 1
+        return [LEVEL_NAMES[i] for i in np.maximum(indexes, 0).tolist()]
+    thresholds = utils.LEVEL_THRESHOLDS
+    return [LEVEL_NAMES[max(bisect_right(thresholds, p) - 1, 0)] for p in points]
+
+
+def recompute_levels(chunk_size: int = 50000, dry_run: bool = False) -> int:
+    """Returns the number of users whose level changed"""
+    conn = engine.raw_connection()
+    started = time.perf_counter()
+    scanned = changed_total = 0
+    last_id = None
+    try:
+        cur = conn.cursor()
+        while True:
+            if last_id is None:
+                cur.execute(
+                    "SELECT id, lifetime_points, level_name FROM users ORDER BY id LIMIT %s",
+                    (chunk_size,),
+                )
+            else:
+                cur.execute(
+                    "SELECT id, lifetime_points, level_name FROM users WHERE id > %s ORDER BY id LIMIT %s",
+                    (last_id, chunk_size),
+                )
+            rows = cur.fetchall()
+            if not rows:
+                break
+            ids, points, current = zip(*rows)
+            changed = [
+                (user_id, new_name, lifetime_points)
+                for user_id, lifetime_points, old_name, new_name in zip(ids, points, current, level_names_for(points))
+                if old_name != new_name
+            ]
+            if changed and not dry_run:
+                execute_values(
+                    cur,
+                    "UPDATE users AS u SET level_name = v.level_name "
+                    "FROM (VALUES %s) AS v(id, level_name, lifetime_points) "
+                    "WHERE u.id = v.id AND u.lifetime_points IS NOT DISTINCT FROM v.lifetime_points",
+                    changed,
+                    template="(%s, %s, %s::integer)",
+                    page_size=len(changed),
+                )
+                changed_total += cur.rowcount
+            else:
+                changed_total += len(changed)
+            conn.commit()  # Short transactions: row locks are held for one chunk only
+            scanned += len(rows)
+            last_id = ids[-1]
+        cur.close()
+    finally:
+        conn.close()
+
+    action = "would change" if dry_run else "changed"
+    print(f"Scanned {scanned} users, {action} {changed_total} levels in {time.perf_counter() - started:.2f}s")
+    return changed_total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute users.level_name from lifetime_points")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--dry-run", action="store_true", help="only count the users that would change")
+    args = parser.parse_args()
+    recompute_levels(args.chunk_size, args.dry_run)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 
@@ -24,7 +24,7 @@ class OrderCreate(BaseModel):
     user_id: int
     items_summary: str
     total_price: int
-    points_used: int
+    points_used: int = Field(ge=0)
     pickup_time: Optional[str] = None
     comment: Optional[str] = None
 
@@ -36,6 +36,32 @@ class Order(OrderCreate):
     class Config:
         from_attributes = True
 
+class OrderSummary(BaseModel):
+    """Order history row: schemas.Order without user_id/comment"""
+    id: str
+    items_summary: str
+    total_price: int
+    points_used: int
+    points_earned: int
+    pickup_time: Optional[str] = None
+    created_at: datetime
+
+class OrderHistoryPage(BaseModel):
+    orders: list[OrderSummary]
+    next_cursor: Optional[str] = None  # Pass back as ?cursor= for the next (older) page
+
+class OrderBatchCreate(BaseModel):
+    orders: list[OrderCreate] = Field(min_length=1, max_length=500)
+
+class OrderBatchResult(BaseModel):
+    index: int  # Position in OrderBatchCreate.orders
+    ok: bool
+    order: Optional[Order] = None
+    error: Optional[str] = None
+
+class OrderBatchResponse(BaseModel):
+    results: list[OrderBatchResult]
+
 # Phase 3: Menu Schemas
 class ModifierBase(BaseModel):
     modifier_type: str  # "size", "milk", "syrup"
@@ -101,6 +127,36 @@ class Category(CategoryBase):
 class MenuResponse(BaseModel):
     categories: list[Category]
 
+# Bulk menu import: the same tree as MenuResponse, ids optional
+class ModifierSync(ModifierBase):
+    id: Optional[int] = None
+
+class ProductSync(BaseModel):
+    id: Optional[int] = None
+    name: str
+    description: Optional[str] = None
+    price: int
+    image_url: Optional[str] = None
+    video_url: Optional[str] = None
+    sort_order: int = 0
+    modifiers: list[ModifierSync] = []
+
+class CategorySync(CategoryBase):
+    products: list[ProductSync] = []
+
+class MenuSync(BaseModel):
+    categories: list[CategorySync]
+
+class SyncCounts(BaseModel):
+    inserted: int = 0
+    updated: int = 0
+    deleted: int = 0
+
+class MenuSyncResult(BaseModel):
+    categories: SyncCounts
+    products: SyncCounts
+    modifiers: SyncCounts
+
 class FavoriteBase(BaseModel):
     product_id: int
 
@@ -113,3 +169,21 @@ class Favorite(FavoriteBase):
 
     class Config:
         from_attributes = True
+
+# Diagnostics
+class PoolStatus(BaseModel):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    max_overflow: int
+    timeout: float
+    checkouts: int = 0
+    waits: int = 0
+    wait_time_total: float = 0.0  # seconds
+    wait_time_max: float = 0.0
+    timeouts: int = 0
+
+class PoolDiagnostics(BaseModel):
+    pid: int  # Worker process that answered
+    pools: dict[str, PoolStatus]
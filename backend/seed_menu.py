@@ -1,24 +1,35 @@
 """
 Seed script to populate the database with menu data from mockData.ts
-Run this once after setting up the database.
+Run this once after setting up the database; re-running it is safe.
 
-Usage: python seed_menu.py
+Everything is written with bulk multi-row statements in one transaction
+(crud.sync_menu). Existing categories/products/modifiers are matched by
+id or name and updated in place, nothing is deleted.
+
+Usage:
+    python seed_menu.py               # built-in menu below
+    python seed_menu.py menu.json     # {"categories": [...]} tree (as from
+                                      # /api/admin/menu/export), or
+                                      # {"categories": [...], "products": [...]}
+                                      # flat lists like CATEGORIES/PRODUCTS
+    python seed_menu.py menu.csv      # one product per row: category_id,
+                                      # category_name, category_sort_order, name,
+                                      # description, price, image_url, video_url,
+                                      # sort_order, modifiers (JSON list)
 """
 
 import sys
 import os
+import csv
+import json
 
 # Add backend to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from database import SessionLocal, engine
-import models
 import crud
+import migrations
 import schemas
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
-
 # Menu data (extracted from mockData.ts)
 CATEGORIES = [
     {"id": "coffee", "name": "Кофе и напитки", "sort_order": 0},
@@ -239,34 +250,60 @@ PRODUCTS = [
     },
 ]
 
-def seed_database():
+def build_menu(categories: list, products: list) -> schemas.MenuSync:
+    """Nest flat CATEGORIES/PRODUCTS-style lists into a MenuSync tree"""
+    tree = {c["id"]: dict(c, products=[]) for c in categories}
+    for product in products:
+        product = dict(product)
+        tree[product.pop("category_id")]["products"].append(product)
+    return schemas.MenuSync(categories=list(tree.values()))
+
+def load_menu_file(path: str) -> schemas.MenuSync:
+    if path.endswith(".csv"):
+        categories, products = {}, []
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                category_id = row["category_id"]
+                categories.setdefault(category_id, {
+                    "id": category_id,
+                    "name": row.get("category_name") or category_id,
+                    "sort_order": int(row.get("category_sort_order") or 0),
+                })
+                products.append({
+                    "name": row["name"],
+                    "description": row.get("description") or None,
+                    "price": int(row["price"]),
+                    "category_id": category_id,
+                    "image_url": row.get("image_url") or None,
+                    "video_url": row.get("video_url") or None,
+                    "sort_order": int(row.get("sort_order") or 0),
+                    "modifiers": json.loads(row.get("modifiers") or "[]"),
+                })
+        return build_menu(list(categories.values()), products)
+
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if "products" in data:
+        return build_menu(data["categories"], data["products"])
+    return schemas.MenuSync(**data)
+
+def seed_database(menu: schemas.MenuSync = None):
+    if menu is None:
+        menu = build_menu(CATEGORIES, PRODUCTS)
+
+    from database import SessionLocal  # Creates the engine; build_menu & co. don't need it
+
     db = SessionLocal()
-    
     try:
-        # Check if already seeded
-        existing_categories = crud.get_categories(db)
-        if existing_categories:
-            print("Database already seeded. Skipping...")
-            return
-        
-        print("Seeding categories...")
-        for cat_data in CATEGORIES:
-            cat = schemas.CategoryCreate(**cat_data)
-            crud.create_category(db, cat)
-            print(f"  + {cat_data['name']}")
-        
-        print("\nSeeding products...")
-        for prod_data in PRODUCTS:
-            modifiers = prod_data.pop("modifiers", [])
-            modifier_schemas = [schemas.ModifierCreate(**m) for m in modifiers]
-            product = schemas.ProductCreate(**prod_data, modifiers=modifier_schemas)
-            crud.create_product(db, product)
-            print(f"  + {prod_data['name']} ({len(modifiers)} modifiers)")
-        
+        counts = crud.sync_menu(db, menu, prune=False)
+        for table, c in counts.items():
+            print(f"  {table}: +{c['inserted']} inserted, {c['updated']} updated")
         print("\n✅ Database seeded successfully!")
-        
     finally:
         db.close()
 
 if __name__ == "__main__":
-    seed_database()
+    from database import engine
+
+    migrations.upgrade(engine)
+    seed_database(load_menu_file(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,361 @@
+"""
+Precompressed static files for the SPA build (dist/).
+
+precompress() writes a .gz (and .br when the brotli package is installed)
+next to every compressible file, or an empty .gz.skip/.br.skip marker where
+compressing doesn't make it smaller. It runs at build time (render_build.sh)
+and again on startup, where it only touches files that changed. The server then
+sends the smallest variant the client accepts, without compressing anything
+per request.
+
+StaticIndex scans a directory once at startup so requests are served from an
+in-memory index instead of filesystem lookups.
+
+Usage: python static_assets.py [dist_dir]
+"""
+import gzip
+import mimetypes
+import mmap
+import os
+import sys
+import threading
+import time
+from email.utils import formatdate
+from typing import NamedTuple, Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.types import Receive, Scope, Send
+
+from http_cache import etag_matches
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {
+    ".html", ".js", ".mjs", ".css", ".json", ".map", ".svg", ".txt", ".xml", ".ico", ".webmanifest",
+}
+MIN_SIZE = 1024  # Smaller files gain nothing worth a Content-Encoding
+
+# Encodings in order of preference, with the suffix of their precompressed file
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Missing from older mimetypes tables (Python 3.9 guesses None for .avif)
+for _type, _ext in (
+    ("image/avif", ".avif"), ("image/webp", ".webp"), ("video/webm", ".webm"),
+    ("text/javascript", ".mjs"), ("application/manifest+json", ".webmanifest"),
+):
+    mimetypes.add_type(_type, _ext)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+# Left instead of a variant that wouldn't be smaller, so the file isn't
+# compressed again on every startup just to find that out
+SKIP_SUFFIX = ".skip"
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_if_smaller(path: str, data: bytes, original_size: int):
+    if len(data) < original_size:
+        # Every worker precompresses on startup; write aside and rename so a
+        # concurrent scan() never stats (and serves) a half-written variant
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        _remove(path + SKIP_SUFFIX)
+    else:
+        open(path + SKIP_SUFFIX, "wb").close()
+        _remove(path)
+
+
+def _is_current(target: str, mtime: float) -> bool:
+    """target, or its skip marker, is at least as new as the original"""
+    for candidate in (target, target + SKIP_SUFFIX):
+        try:
+            if os.stat(candidate).st_mtime >= mtime:
+                return True
+        except FileNotFoundError:
+            pass
+    return False
+
+
+def precompress(directory: str) -> int:
+    """Write missing/outdated .gz/.br variants, returns the number of files compressed"""
+    compressed = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            stat = os.stat(path)
+            if stat.st_size < MIN_SIZE:
+                continue
+            targets = [(path + ".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                targets.append((path + ".br", lambda data: brotli.compress(data, quality=11)))
+            outdated = [(target, compress) for target, compress in targets if not _is_current(target, stat.st_mtime)]
+            if not outdated:
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            for target, compress in outdated:
+                _write_if_smaller(target, compress(data), stat.st_size)
+            compressed += 1
+    return compressed
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Codings from an Accept-Encoding header, minus the ones refused with q=0"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding)
+    return accepted
+
+
+def negotiate(variants: dict, accept_encoding: str) -> Optional[str]:
+    """Best Content-Encoding among the available variants, None for identity"""
+    if not variants:
+        return None
+    accepted = accepted_encodings(accept_encoding)
+    for coding, _ in ENCODINGS:
+        if coding in variants and (coding in accepted or "*" in accepted):
+            return coding
+    return None
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header: str, size: int):
+    """(start, end) inclusive for a single "bytes=" range, None to ignore the header.
+
+    Multiple ranges and malformed headers are ignored (the full file is sent,
+    as RFC 9110 allows); ranges starting past the end raise RangeNotSatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash:
+        return None
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start is None:
+        if end is None:
+            return None
+        if end == 0:  # Empty suffix
+            raise RangeNotSatisfiable(header)
+        return max(size - end, 0), size - 1
+    if end is not None and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    if end is None:
+        end = size - 1
+    return start, min(end, size - 1)
+
+
+class MappedFileResponse(Response):
+    """Body served from a shared read-only mmap of the file, in chunks.
+
+    Each chunk is copied out of the mapping in the thread pool: on a cold page
+    cache the copy page-faults into disk reads, which must not block the loop.
+    """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, mapping, start: int, stop: int, status_code: int, headers: dict, media_type: str):
+        super().__init__(None, status_code=status_code, headers=headers, media_type=media_type)
+        self.mapping, self.start, self.stop = mapping, start, stop
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope["method"].upper() == "HEAD" or self.start >= self.stop:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        for offset in range(self.start, self.stop, self.chunk_size):
+            end = min(offset + self.chunk_size, self.stop)
+            chunk = await run_in_threadpool(self.mapping.__getitem__, slice(offset, end))
+            await send({"type": "http.response.body", "body": chunk, "more_body": end < self.stop})
+
+
+class IndexedFile(NamedTuple):
+    path: str
+    media_type: str
+    etag: str
+    stat: os.stat_result
+    variants: dict  # Content-Encoding -> IndexedFile of the precompressed sibling
+
+
+def _indexed_file(path: str, stat_result: os.stat_result) -> IndexedFile:
+    return IndexedFile(
+        path=path,
+        media_type=mimetypes.guess_type(path)[0] or "application/octet-stream",
+        etag=f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"',
+        stat=stat_result,
+        variants={},
+    )
+
+
+class StaticIndex:
+    """Every file under a directory, scanned once.
+
+    Lookups are dict hits on the normalized relative path ("assets/app.js"),
+    so serving a file costs no stat/exists calls, and nothing outside the
+    directory (../, absolute paths, symlinked dirs) can ever be a key.
+    Files listed in keep_in_memory are served from bytes read at scan time.
+    With reload=True (dev) the directory is rescanned at most once per
+    RELOAD_INTERVAL seconds, on lookup.
+    """
+
+    RELOAD_INTERVAL = 1.0
+
+    def __init__(self, directory: str, reload: bool = False, keep_in_memory=("index.html",)):
+        self.directory = os.path.realpath(directory)
+        self.reload = reload
+        self.keep_in_memory = keep_in_memory
+        self.files = {}
+        self.contents = {}
+        self._scanned_at = 0.0
+        self._lock = threading.Lock()
+        self._mappings = {}
+
+    def scan(self) -> int:
+        found = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".tmp"):
+                    continue  # Being written by precompress() in another worker
+                if any(name.endswith(suffix + SKIP_SUFFIX) for _, suffix in ENCODINGS):
+                    continue  # precompress() marker, not a file to serve
+                path = os.path.join(root, name)
+                try:
+                    stat_result = os.stat(path)
+                except OSError:
+                    continue
+                found[os.path.relpath(path, self.directory).replace(os.sep, "/")] = _indexed_file(path, stat_result)
+
+        files = {}
+        for rel, entry in found.items():
+            base, ext = os.path.splitext(rel)
+            if base in found and any(ext == suffix for _, suffix in ENCODINGS):
+                continue  # Precompressed variant, attached to its original below
+            variants = {coding: found[rel + suffix] for coding, suffix in ENCODINGS if rel + suffix in found}
+            files[rel] = entry._replace(variants=variants)
+
+        contents = {}
+        for rel in self.keep_in_memory:
+            if rel in files:
+                for entry in (files[rel], *files[rel].variants.values()):
+                    with open(entry.path, "rb") as f:
+                        contents[entry.path] = f.read()
+
+        # Swap both at once: concurrent lookups see the old or the new index
+        self.files, self.contents = files, contents
+        self._scanned_at = time.monotonic()
+        return len(files)
+
+    def get(self, path: str) -> Optional[IndexedFile]:
+        if self.reload and time.monotonic() - self._scanned_at > self.RELOAD_INTERVAL:
+            with self._lock:
+                if time.monotonic() - self._scanned_at > self.RELOAD_INTERVAL:
+                    self.scan()
+        return self.files.get(path)
+
+    def response(self, entry: IndexedFile, request: Request, cache_control: str) -> Response:
+        """The best encoded variant of entry, or 304 when the client's copy is current"""
+        headers = {"Cache-Control": cache_control}
+        send = entry
+        if entry.variants or os.path.splitext(entry.path)[1] in COMPRESSIBLE_EXTENSIONS:
+            headers["Vary"] = "Accept-Encoding"
+            coding = negotiate(entry.variants, request.headers.get("accept-encoding", ""))
+            if coding:
+                send = entry.variants[coding]
+                headers["Content-Encoding"] = coding
+        headers["ETag"] = send.etag
+        headers["Last-Modified"] = formatdate(send.stat.st_mtime, usegmt=True)
+        if etag_matches(request, send.etag):
+            return Response(status_code=304, headers=headers)
+        body = self.contents.get(send.path)
+        if body is not None:
+            return Response(body, media_type=entry.media_type, headers=headers)
+        return FileResponse(send.path, media_type=entry.media_type, headers=headers, stat_result=send.stat)
+
+    def _mapping(self, entry: IndexedFile):
+        """One mmap per file version, shared by every request streaming it"""
+        key = (entry.path, entry.stat.st_mtime_ns, entry.stat.st_size)
+        mapping = self._mappings.get(key)
+        if mapping is None:
+            with self._lock:
+                mapping = self._mappings.get(key)
+                if mapping is None:
+                    with open(entry.path, "rb") as f:
+                        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    # Older versions are dropped here and unmapped once their last response finishes
+                    self._mappings = {k: m for k, m in self._mappings.items() if k[0] != entry.path}
+                    self._mappings[key] = mapping
+        return mapping
+
+    def range_response(self, entry: IndexedFile, request: Request, cache_control: str) -> Response:
+        """entry with Range/If-Range support (206/416), for media players that seek"""
+        size = entry.stat.st_size
+        last_modified = formatdate(entry.stat.st_mtime, usegmt=True)
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Cache-Control": cache_control,
+            "ETag": entry.etag,
+            "Last-Modified": last_modified,
+        }
+        if etag_matches(request, entry.etag):
+            return Response(status_code=304, headers=headers)
+
+        start, end, status_code = 0, size - 1, 200
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        # If-Range: the range only applies to the version the client already has part of
+        # (strong ETag comparison, or the exact Last-Modified date)
+        if range_header and (if_range is None or if_range.strip() in (entry.etag, last_modified)):
+            try:
+                parsed = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                headers["Content-Range"] = f"bytes */{size}"
+                return Response(status_code=416, headers=headers)
+            if parsed:
+                start, end = parsed
+                status_code = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        if size == 0:
+            return Response(b"", status_code=status_code, headers=headers, media_type=entry.media_type)
+        return MappedFileResponse(self._mapping(entry), start, end + 1, status_code, headers, entry.media_type)
+
+
+if __name__ == "__main__":
+    dist = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "../dist")
+    count = precompress(dist)
+    print(f"Precompressed {count} files in {dist}" + ("" if brotli else " (gzip only: brotli not installed)"))
@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import schemas
+
+
+class UserCache:
+    """Bounded LRU of schemas.User snapshots with a TTL.
+
+    crud writes to users put the fresh row here (or evict it), other workers'
+    writes arrive through cache_bus, so the TTL only bounds staleness for
+    changes made outside the app.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[int, tuple[float, schemas.User]]" = OrderedDict()
+        # Eviction counter, and when each recently evicted id was last evicted
+        self._generation = 0
+        self._evicted: "OrderedDict[int, int]" = OrderedDict()
+        self._evicted_floor = 0  # Newest generation dropped from _evicted
+
+    @property
+    def generation(self) -> int:
+        """Read before loading a row for put(..., loaded_at=...)"""
+        return self._generation
+
+    def get(self, user_id: int) -> Optional[schemas.User]:
+        with self._lock:
+            item = self._items.get(user_id)
+            if item is None:
+                return None
+            expires_at, user = item
+            if expires_at < time.monotonic():
+                del self._items[user_id]
+                return None
+            self._items.move_to_end(user_id)
+            return user
+
+    def put(self, user: schemas.User, loaded_at: Optional[int] = None):
+        """Store user; with loaded_at, only if it wasn't evicted since (the row may predate that write)"""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if loaded_at is not None and max(self._evicted.get(user.id, 0), self._evicted_floor) > loaded_at:
+                return
+            self._items[user.id] = (time.monotonic() + self.ttl, user)
+            self._items.move_to_end(user.id)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def evict(self, user_id: int):
+        with self._lock:
+            self._items.pop(user_id, None)
+            self._generation += 1
+            self._evicted[user_id] = self._generation
+            self._evicted.move_to_end(user_id)
+            if len(self._evicted) > max(self.maxsize, 1):
+                _, self._evicted_floor = self._evicted.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._generation += 1
+            self._evicted.clear()
+            self._evicted_floor = self._generation
+
+
+user_cache = UserCache(
+    maxsize=int(os.getenv('USER_CACHE_SIZE', '10000')),
+    ttl=float(os.getenv('USER_CACHE_TTL', '30')),
+)
@@ -1,3 +1,4 @@
+from bisect import bisect_right
 from typing import Tuple, Optional
 
 COFFEE_LEVELS = [
@@ -8,23 +9,21 @@ COFFEE_LEVELS = [
   {'id': '5', 'name': 'Кофейный Монарх', 'pointsRequired': 1000},
 ]
 
+# Sorted pointsRequired thresholds, for binary search over COFFEE_LEVELS
+LEVEL_THRESHOLDS = [level['pointsRequired'] for level in COFFEE_LEVELS]
+
 def get_level_info(points: int) -> dict:
     # Find the highest level with pointsRequired <= points
-    current_level = COFFEE_LEVELS[0]
-    for level in COFFEE_LEVELS:
-        if points >= level['pointsRequired']:
-            current_level = level
-        else:
-            break
-    return current_level
+    index = bisect_right(LEVEL_THRESHOLDS, points) - 1
+    return COFFEE_LEVELS[max(index, 0)]
 
 def get_next_level_points(points: int) -> int:
-    for level in COFFEE_LEVELS:
-        if level['pointsRequired'] > points:
-            return level['pointsRequired']
+    index = bisect_right(LEVEL_THRESHOLDS, points)
+    if index < len(LEVEL_THRESHOLDS):
+        return LEVEL_THRESHOLDS[index]
     
     # If max level reachable, return the max level points or some cap
-    return COFFEE_LEVELS[-1]['pointsRequired']
+    return LEVEL_THRESHOLDS[-1]
 
 def calculate_user_level(lifetime_points: int) -> Tuple[str, int]:
     """Returns (level_name, next_level_points)"""
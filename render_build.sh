@@ -11,4 +11,10 @@ npm install
 echo "Building Frontend..."
 npm run build
 
+echo "Precompressing frontend assets..."
+python backend/static_assets.py dist
+
+echo "Generating responsive image variants..."
+python backend/image_variants.py public/images
+
 echo "Build successful!"
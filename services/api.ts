@@ -86,14 +86,9 @@ export const api = {
 
     // Phase 3: Menu API
     async getMenu(): Promise<{ categories: any[] }> {
-        // Add timestamp to prevent aggressive caching in Telegram WebView
-        const timestamp = Date.now();
-        const response = await fetch(`${API_URL}/menu?_t=${timestamp}`, {
-            cache: 'no-store',
-            headers: {
-                'Cache-Control': 'no-cache, no-store, must-revalidate',
-                'Pragma': 'no-cache'
-            }
+        // Always revalidate: the backend answers If-None-Match with 304 when the menu is unchanged
+        const response = await fetch(`${API_URL}/menu`, {
+            cache: 'no-cache',
         });
         if (!response.ok) {
             throw new Error(`Failed to load menu: ${response.status}`);
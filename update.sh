@@ -26,4 +26,8 @@ rm -rf /tmp/history_public_backup /tmp/history_db_backup 2>/dev/null || true
 echo "🔨 Пересборка фронтенда..."
 npm run build
 
+# gzip/brotli-версии файлов сборки (иначе их при старте пишет каждый воркер)
+echo "🗜️ Сжатие файлов фронтенда..."
+python backend/static_assets.py dist
+
 echo "✅ Готово! Перезапустите сервер: python backend/main.py"